@@ -1,80 +1,144 @@
 # app.py
-import torch
-from flask import Flask, render_template, request, jsonify
-from transformers import AutoTokenizer, AutoModelForCausalLM
-import sqlite3
+import json
+import queue
+import threading
+import time
+from flask import Flask, Response, render_template, request, jsonify
 from handlers import (
     handle_visual,
     handle_report,
     handle_filter_rag,
     handle_rag_query,
-    handle_stress_reason
+    handle_stress_reason,
+    chart_cache
 )
-from util import normalize_column_name, detect_unknown_keywords
-from rag_utils import load_rag_index
+import config
+from util import normalize_column_name, detect_unknown_keywords, extract_stat_request
+from db import init_db, connection, pooled_cursor
+from history import HistoryStore, SESSION_COOKIE, new_session_id
+from router import IntentRouter
 from flask_cors import CORS
-from generators import generate_intent_from_llm
+from generators import generate_intent_from_llm, warmup_prefix_cache, response_cache, ResponseStreamer
 
-import os
-os.environ["CUDA_VISIBLE_DEVICES"]= "3"
 
 #app = Flask(__name__)
 app = Flask(__name__, static_folder="static", template_folder="templates")
 CORS(app)
 
 
-# 모델 로드
-model_path = "models" 
-tokenizer = AutoTokenizer.from_pretrained(model_path)
-model = AutoModelForCausalLM.from_pretrained(
-    model_path,
-    torch_dtype=torch.float16,
-    device_map="auto"
-)
-model.eval()
+# DB 연결 (가벼운 단계라 import 시점에 끝낸다)
+with connection() as conn:
+    init_db(conn)
+    candidate_names = [row[0] for row in conn.execute("SELECT DISTINCT name FROM user_data")]
+router = IntentRouter(candidate_names)
+# 세션(쿠키)별 대화 기록
+history_store = HistoryStore()
+
+# 무거운 구성요소는 단계별로 백그라운드에서 올린다. 준비 전에도 chitchat / name_only / SQL 조건 검색,
+# 템플릿 통계, 그래프처럼 LLM 이 필요 없는 질문은 바로 답한다.
+model = tokenizer = remote_embedder = None
+embedder = faiss_index = corpus = None
+query_encoder = intent_classifier = None
+stages = {"model": "pending", "rag": "pending", "warmup": "pending"}  # pending → loading → ready / failed
+started_at = time.monotonic()
+
+
+class ServiceLoading(Exception):
+    """질문에 필요한 구성요소가 아직 준비되지 않음."""
+
+    def __init__(self, components):
+        super().__init__(", ".join(components))
+        self.components = components
+
+
+class ServiceFailed(Exception):
+    """질문에 필요한 구성요소의 초기화가 실패함 (기다려도 준비되지 않는다)."""
+
+    def __init__(self, components):
+        super().__init__(", ".join(components))
+        self.components = components
+
+
+def require_components(components):
+    """준비되지 않은 구성요소가 있으면 실패한 것은 ServiceFailed, 로딩 중인 것은 ServiceLoading."""
+    failed = [name for name in components if stages[name].startswith("failed")]
+    if failed:
+        raise ServiceFailed(failed)
+    if components:
+        raise ServiceLoading(components)
+
+
+def load_model():
+    global model, tokenizer, remote_embedder
+    if config.MODEL_SERVER_ADDRESS:
+        # 모델 서버가 LLM / 임베딩 모델을 갖고 있고 이 워커는 토크나이저만 올린다
+        from model_server import connect
+
+        llm, tok, remote_embedder = connect()
+    else:
+        from backends import load_llm
+
+        llm, tok = load_llm()
+    # 템플릿 고정 prefix 의 KV 캐시 미리 계산
+    warmup_prefix_cache(llm, tok)
+    model, tokenizer = llm, tok
+
 
-# RAG 모델 로드
-embedder, faiss_index, corpus = load_rag_index()
+def load_rag():
+    global embedder, faiss_index, corpus, query_encoder, intent_classifier
+    from rag_utils import load_rag_index, QueryEncoder
+    from intent_classifier import IntentClassifier
 
+    # RAG 모델 로드 (모델 서버를 쓰면 임베딩만 원격으로)
+    embedder, faiss_index, corpus = load_rag_index(embedder=remote_embedder)
+    # 질의 임베딩 캐시 + 마이크로 배치
+    encoder = QueryEncoder(embedder)
+    # ambiguous 질문용 로컬 intent 분류기 (같은 임베딩 모델 사용)
+    intent_classifier = IntentClassifier(encoder)
+    query_encoder = encoder
 
-# DB 연결
-conn = sqlite3.connect("user_data.db", check_same_thread=False)
-cursor = conn.cursor()
-cursor.execute("SELECT DISTINCT name FROM user_data")
-candidate_names = [row[0] for row in cursor.fetchall()]
-chat_history = []
+
+def warmup():
+    # 첫 사용자 요청이 CUDA 초기화, 커널 선택, matplotlib import 를 떠안지 않도록 한 번씩 돌려 본다
+    from generators import get_generation_engine
+    from charts import render_timeseries
+
+    query_encoder.encode("ppg 정상 범위")
+    get_generation_engine(model, tokenizer).generate("Response:", max_new_tokens=2)
+    render_timeseries(["2025-01-01", "2025-01-02"], [0.0, 1.0])
+
+
+def _run_stages():
+    for name, load in [("model", load_model), ("rag", load_rag), ("warmup", warmup)]:
+        stages[name] = "loading"
+        t0 = time.monotonic()
+        try:
+            load()
+        except Exception as e:
+            stages[name] = f"failed: {e}"
+            app.logger.exception("%s 단계 초기화 실패", name)
+            continue
+        stages[name] = "ready"
+        app.logger.info("%s 단계 준비 완료 (%.1fs)", name, time.monotonic() - t0)
+
+
+def is_ready():
+    return all(state == "ready" for state in stages.values())
+
+
+def has_failed():
+    return any(state.startswith("failed") for state in stages.values())
+
+
+if config.STARTUP_BLOCKING:
+    _run_stages()
+else:
+    threading.Thread(target=_run_stages, name="startup", daemon=True).start()
     
 
-# 더 구체화한 intent   
+# 더 구체화한 intent (키워드와 이름을 Aho–Corasick 자동자로 한 번에 찾는다, router.py)
 def classify_question(question: str):
-    import re
-    
-    if re.search(r"(최대|최소|중앙값|요약|통계)", question):
-        return "report"
-    if re.search(r"(그래프|추이|그려줘|시계열|선 그래프)", question):
-        return "visual"
-    # 조건 + 사람 형태 → filter_rag
-    if re.search(r"(이상|이하|보다 큰|보다 낮은|조건에 맞는)", question) and re.search(r"(사람|누구|사용자|이름|찾아|있어)", question):
-        return "filter_rag"
-    if re.search(r"(높은거야|낮은거야|기준|정상|의미|무슨 뜻|정의|어때|맞아|괜찮아|높은 편|낮은 편)", question):
-        return "rag"
-    if re.match(r"^(안녕|ㅎ+|하+|헐|뭐야|ㅋㅋ+|ㅎㅎ+|테스트|hi|hello)$", question.strip(), re.IGNORECASE):
-        return "chitchat"
-    if any(name == question.strip() for name in candidate_names):
-        return "name_only"
-    if re.search(r"(왜|이유|원인).*스트레스.*(높|많|낮|작)", question):
-        return "stress_reason"
-
-    # 여기까지 다 해당 안 되면 애매한 질문
-    return "ambiguous"
-
-
-
-def extract_name_from_question(question: str, candidate_names: list):
-    for name in candidate_names:
-        if name in question:
-            return name
-    return None
+    return router.route(question)[0]
 
 
 @app.route("/")
@@ -82,30 +146,150 @@ def index():
     return render_template("chat.html")
 
 
+@app.route("/healthz")
+def healthz():
+    # 프로세스가 살아 있는지만 본다 (모델 로딩 중에도 200)
+    return jsonify({"status": "ok", "uptime": round(time.monotonic() - started_at, 1)})
+
+
+@app.route("/readyz")
+def readyz():
+    # 모든 단계가 준비돼야 200. 롤링 재시작 시 트래픽 전환 기준으로 쓴다
+    # 로딩 중이면 503, 초기화에 실패한 단계가 있으면 기다려도 소용없으므로 500
+    status = 200 if is_ready() else 500 if has_failed() else 503
+    return jsonify({"ready": is_ready(), "failed": has_failed(), "stages": stages}), status
+
+
+def loading_response(components):
+    return {
+        "intent": "loading",
+        "response": "모델을 불러오는 중입니다. 잠시 후 다시 시도해주세요.",
+        "loading": components,
+    }
+
+
+def failed_response(components):
+    return {
+        "intent": "unavailable",
+        "response": "필요한 구성요소를 불러오지 못해 이 질문에는 답할 수 없습니다. 관리자에게 문의해주세요.",
+        "failed": components,
+    }
+
+
+@app.route("/metrics")
+def metrics():
+    # 캐시 적중률 (응답 / 그래프 / 질의 임베딩)
+    return jsonify({
+        "response_cache": response_cache.stats(),
+        "chart_cache": chart_cache.stats(),
+        "embed_cache": query_encoder.cache.stats() if query_encoder else None,
+        "history": history_store.stats(),
+    })
+
+
 @app.route("/ask", methods=["POST"])
 def ask():
+    # 조회마다 풀에서 연결을 빌려 쓰고 바로 돌려준다 (생성 중에는 연결을 잡고 있지 않는다)
+    session_id = request.cookies.get(SESSION_COOKIE) or new_session_id()
+    try:
+        response = jsonify(answer_question(pooled_cursor(), request.json.get("message"), session_id=session_id))
+    except ServiceLoading as e:
+        response = jsonify(loading_response(e.components))
+        response.status_code = 503
+        response.headers["Retry-After"] = str(config.ASGI_RETRY_AFTER)
+    except ServiceFailed as e:
+        response = jsonify(failed_response(e.components))
+        response.status_code = 500
+    return with_session(response, session_id)
+
+
+@app.route("/ask/stream", methods=["POST"])
+def ask_stream():
+    # Server-Sent Events: 생성 중인 텍스트는 token 이벤트로, 최종 응답 dict 는 done 이벤트로 보낸다
     user_question = request.json.get("message")
+    session_id = request.cookies.get(SESSION_COOKIE) or new_session_id()
+    events = queue.Queue()
+
+    def run():
+        streamer = ResponseStreamer(lambda text: events.put({"type": "token", "text": text}))
+        try:
+            result = answer_question(pooled_cursor(), user_question, streamer=streamer, session_id=session_id)
+        except ServiceLoading as e:
+            result = loading_response(e.components)
+        except ServiceFailed as e:
+            result = failed_response(e.components)
+        except Exception as e:
+            result = {"intent": "unknown", "response": f"응답 생성 중 오류가 발생했습니다: {str(e)}"}
+        events.put({"type": "done", **result})
+
+    threading.Thread(target=run, daemon=True).start()
+
+    def stream():
+        while True:
+            event = events.get()
+            yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+            if event["type"] == "done":
+                break
+
+    response = Response(stream(), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    return with_session(response, session_id)
+
+
+def with_session(response, session_id):
+    response.set_cookie(SESSION_COOKIE, session_id, httponly=True, samesite="Lax")
+    return response
+
+
+def resolve_ambiguous_intent(question):
+    if intent_classifier is None and model is None:
+        require_components([name for name in ["rag", "model"] if stages[name] != "ready"])
+
+    def ask_llm(q):
+        return generate_intent_from_llm(q, model, tokenizer) if model is not None else "ambiguous"
+
+    if intent_classifier is None:
+        return ask_llm(question)
+    return intent_classifier.classify(question, ask_llm)
+
+
+def missing_components(intent, question):
+    """intent 처리에 필요한데 아직 준비되지 않은 단계 목록."""
+    if intent == "rag":
+        needs = ["rag", "model"]
+    elif intent == "stress_reason":
+        needs = ["model"]
+    elif intent == "report" and not extract_stat_request(question):
+        needs = ["model"]
+    elif intent == "visual" and config.VISUAL_CODEGEN:
+        needs = ["model"]
+    else:
+        needs = []
+    return [name for name in needs if stages[name] != "ready"]
+
+
+def answer_question(cursor, user_question, streamer=None, session_id=None):
+    """질문 하나를 처리해 응답 dict 를 돌려준다. streamer 가 있으면 LLM 답변을 생성 중에 흘려보낸다."""
+    chat_history = history_store.get(session_id)
     if not user_question:
-        return jsonify({"response": "질문이 비어 있습니다."})
+        return {"response": "질문이 비어 있습니다."}
 
     unknown = detect_unknown_keywords(user_question)
     if unknown:
-        return jsonify({"intent": "unknown", "response": unknown})
+        return {"intent": "unknown", "response": unknown}
 
     user_question, _ = normalize_column_name(user_question)
     chat_history.append({"role": "user", "content": user_question})
 
-    # 1차 rule-based 분류
-    intent = classify_question(user_question)
-    # 2차 LLM fallback 분류
-    if intent == "ambiguous":  
-        intent = generate_intent_from_llm(user_question, model, tokenizer)
-    
-    target_name = extract_name_from_question(user_question, candidate_names)
+    # 1차 rule-based 분류 (intent 와 이름을 한 번에)
+    intent, target_name = router.route(user_question)
+    # 2차 임베딩 분류기, 확신이 낮을 때만 LLM fallback 분류
+    if intent == "ambiguous":
+        intent = resolve_ambiguous_intent(user_question)
     
     # 3차 사용자 확인 fallback
     if intent == "ambiguous":
-        return jsonify({
+        return {
             "intent": "ambiguous",
             "response": (
                 "질문이 조금 모호합니다. 아래와 같은 방식으로 질문을 바꿔보세요.\n예시:\n"
@@ -115,72 +299,76 @@ def ask():
                 "- 'ppg 120이면 높은 편이야?'\n"
                 "처럼 보다 구체적인 정보를 포함해 주세요."
             )
-        })
+        }
     
     # 이름 유효성 검사 
     if intent in ["visual", "report"] and not target_name:
-        return jsonify({
+        return {
             "intent": intent,
             "response": "질문하신 사용자 이름을 찾을 수 없습니다. 올바른 이름을 입력해주세요."
-        })
+        }
+
+    require_components(missing_components(intent, user_question))
         
     if intent == "visual" and target_name:
         try:
             code = handle_visual(user_question, model, tokenizer, target_name, cursor)
-            return jsonify({
+            return {
                 "intent": "visual",
                 "response": "그래프가 생성되었습니다.",
                 "image_base64": code
-            })
+            }
         except Exception as e:
-            return jsonify({
+            return {
                 "intent": "visual",
                 "response": f"그래프 생성 중 오류가 발생했습니다: {str(e)}"
-            })
+            }
 
     elif intent == "report":
         try:
-            response = handle_report(user_question, model, tokenizer, candidate_names, cursor)
+            response = handle_report(user_question, model, tokenizer, target_name, cursor, streamer=streamer)
             chat_history.append({"role": "assistant", "content": response})
-            return jsonify({"intent": "report", "response": response})
+            return {"intent": "report", "response": response}
         except Exception as e:
-            return jsonify({"intent": "report", "response": f"데이터 분석 중 오류가 발생했습니다: {str(e)}"})
+            return {"intent": "report", "response": f"데이터 분석 중 오류가 발생했습니다: {str(e)}"}
 
     elif intent == "filter_rag":
         try:
             response = handle_filter_rag(user_question, model, tokenizer, chat_history, cursor, candidate_names)
             chat_history.append({"role": "assistant", "content": response})
-            return jsonify({"intent": "filter_rag", "response": response})
+            return {"intent": "filter_rag", "response": response}
         except Exception as e:
-            return jsonify({"intent": "filter_rag", "response": f"데이터 필터링 중 오류가 발생했습니다: {str(e)}"})
+            return {"intent": "filter_rag", "response": f"데이터 필터링 중 오류가 발생했습니다: {str(e)}"}
         
     elif intent == "rag":
         try:
-            response = handle_rag_query(user_question, model, tokenizer, embedder, faiss_index, corpus)
+            response = handle_rag_query(user_question, model, tokenizer, query_encoder, faiss_index, corpus,
+                                        streamer=streamer)
             chat_history.append({"role": "assistant", "content": response})
-            return jsonify({"intent": "rag", "response": response})
+            return {"intent": "rag", "response": response}
         except Exception as e:
-            return jsonify({"intent": "rag", "response": f"응답 생성 중 오류가 발생했습니다: {str(e)}"})
+            return {"intent": "rag", "response": f"응답 생성 중 오류가 발생했습니다: {str(e)}"}
         
     elif intent == "chitchat":
-        return jsonify({
+        return {
             "intent": "chitchat",
             "response": "안녕하세요! PPG, HRV, 스트레스 등에 대해 물어보시면 도와드릴 수 있어요 :)"
-        })
+        }
         
     elif intent == "name_only":
-        return jsonify({
+        return {
             "intent": "name_only",
             "response": f"{target_name}님의 어떤 정보를 원하시나요? 예: 'ppg 평균 알려줘', '그래프 보여줘'"
-        })
+        }
 
     elif intent == "stress_reason":
         try:
-            response = handle_stress_reason(user_question, model, tokenizer, candidate_names, cursor)
+            response = handle_stress_reason(user_question, model, tokenizer, target_name, cursor,
+                                            streamer=streamer)
             chat_history.append({"role": "assistant", "content": response})
-            return jsonify({"intent": "stress_reason", "response": response})
+            return {"intent": "stress_reason", "response": response}
         except Exception as e:
-            return jsonify({"intent": "stress_reason", "response": f"분석 중 오류 발생: {str(e)}"})
+            return {"intent": "stress_reason", "response": f"분석 중 오류 발생: {str(e)}"}
 
 
 if __name__ == "__main__":
@@ -0,0 +1,184 @@
+# ASGI 서빙 모드: uvicorn asgi:app --host 0.0.0.0 --port 8000
+# /ask, /ask/stream, /metrics 는 비동기로 처리하고 나머지(화면, static)는 Flask 앱으로 넘긴다.
+#   - chitchat / name_only 같은 가벼운 질문은 기본 executor 에서 바로 답한다 (대화 기록 I/O 가 있어 루프에서는 돌리지 않는다)
+#   - DB 조회, 그래프 렌더링, 템플릿 통계, SQL 필터(filter_rag)는 CPU executor 로 보낸다
+#   - LLM 생성이 필요한 질문은 생성 전용 executor 를 거쳐 공유 엔진 큐에 들어가며,
+#     대기 중인 생성이 상한을 넘으면 503 + Retry-After 로 거절한다
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from starlette.applications import Starlette
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+import config
+import app as flask_app
+from db import pooled_cursor
+from generators import ResponseStreamer, get_generation_engine
+from history import SESSION_COOKIE, new_session_id
+from util import normalize_column_name, detect_unknown_keywords, extract_stat_request
+
+LIGHT_INTENTS = {"chitchat", "name_only"}
+CPU_INTENTS = {"visual"}
+
+cpu_executor = ThreadPoolExecutor(max_workers=config.ASGI_CPU_WORKERS, thread_name_prefix="asgi-cpu")
+# 생성 요청 스레드는 엔진 큐에 넣고 기다리기만 하므로 대기 상한만큼 둔다
+generation_executor = ThreadPoolExecutor(
+    max_workers=config.ASGI_MAX_PENDING_GENERATIONS, thread_name_prefix="asgi-gen"
+)
+
+
+class GenerationGate:
+    """대기 + 진행 중인 생성 요청 수를 제한한다."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.pending = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def try_acquire(self):
+        with self.lock:
+            if self.pending >= self.limit:
+                self.rejected += 1
+                return False
+            self.pending += 1
+            return True
+
+    def release(self):
+        with self.lock:
+            self.pending -= 1
+
+    def stats(self):
+        return {"pending": self.pending, "limit": self.limit, "rejected": self.rejected}
+
+
+generation_gate = GenerationGate(config.ASGI_MAX_PENDING_GENERATIONS)
+
+
+def route_question(question):
+    """질문이 처리될 경로: light / cpu / generation."""
+    if not question or detect_unknown_keywords(question):
+        return "light"
+    question, _ = normalize_column_name(question)
+    intent = flask_app.classify_question(question)
+    if intent in LIGHT_INTENTS:
+        return "light"
+    if intent == "visual" and not config.VISUAL_CODEGEN:
+        return "cpu"
+    if intent == "report" and extract_stat_request(question):
+        return "cpu"  # 템플릿 통계 응답 (LLM 없음)
+    if intent == "filter_rag" and ("안정" in question or flask_app.model is None):
+        return "cpu"  # 안정/불안정 판정과 모델 로딩 중 조회는 SQL 만 쓴다 (조건 조회 요약만 LLM)
+    return "generation"
+
+
+def _answer(question, streamer=None, session_id=None):
+    return flask_app.answer_question(pooled_cursor(), question, streamer=streamer, session_id=session_id)
+
+
+BUSY_RESPONSE = {"intent": "busy", "response": "요청이 많아 잠시 후 다시 시도해주세요."}
+
+
+def _busy():
+    return JSONResponse(BUSY_RESPONSE, status_code=503, headers={"Retry-After": str(config.ASGI_RETRY_AFTER)})
+
+
+def _busy_stream():
+    # chat.html 은 /ask/stream 의 SSE 만 읽으므로 거절도 done 이벤트 하나로 보낸다
+    body = f"data: {json.dumps({'type': 'done', **BUSY_RESPONSE}, ensure_ascii=False)}\n\n"
+    return StreamingResponse(iter([body]), status_code=503, media_type="text/event-stream",
+                             headers={"Retry-After": str(config.ASGI_RETRY_AFTER), "Cache-Control": "no-cache"})
+
+
+async def _run(lane, question, streamer=None, session_id=None):
+    loop = asyncio.get_running_loop()
+    if lane == "light":
+        return await loop.run_in_executor(None, flask_app.answer_question, None, question, None, session_id)
+    if lane == "cpu":
+        return await loop.run_in_executor(cpu_executor, _answer, question, streamer, session_id)
+    try:
+        return await loop.run_in_executor(generation_executor, _answer, question, streamer, session_id)
+    finally:
+        generation_gate.release()
+
+
+async def ask(request):
+    question = (await request.json()).get("message")
+    lane = route_question(question)
+    if lane == "generation" and not generation_gate.try_acquire():
+        return _busy()
+    session_id = request.cookies.get(SESSION_COOKIE) or new_session_id()
+    try:
+        response = JSONResponse(await _run(lane, question, session_id=session_id))
+    except flask_app.ServiceLoading as e:
+        response = JSONResponse(flask_app.loading_response(e.components), status_code=503,
+                                headers={"Retry-After": str(config.ASGI_RETRY_AFTER)})
+    except flask_app.ServiceFailed as e:
+        response = JSONResponse(flask_app.failed_response(e.components), status_code=500)
+    return _with_session(response, session_id)
+
+
+async def ask_stream(request):
+    question = (await request.json()).get("message")
+    lane = route_question(question)
+    if lane == "generation" and not generation_gate.try_acquire():
+        return _busy_stream()
+
+    session_id = request.cookies.get(SESSION_COOKIE) or new_session_id()
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+    # 생성 스레드에서 호출되므로 이벤트 루프로 넘겨 큐에 넣는다
+    streamer = ResponseStreamer(
+        lambda text: loop.call_soon_threadsafe(events.put_nowait, {"type": "token", "text": text})
+    )
+
+    async def run():
+        try:
+            result = await _run(lane, question, streamer, session_id)
+        except flask_app.ServiceLoading as e:
+            result = flask_app.loading_response(e.components)
+        except flask_app.ServiceFailed as e:
+            result = flask_app.failed_response(e.components)
+        except Exception as e:
+            result = {"intent": "unknown", "response": f"응답 생성 중 오류가 발생했습니다: {str(e)}"}
+        await events.put({"type": "done", **result})
+
+    task = asyncio.create_task(run())
+
+    async def stream():
+        while True:
+            event = await events.get()
+            yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+            if event["type"] == "done":
+                break
+        await task
+
+    response = StreamingResponse(stream(), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    return _with_session(response, session_id)
+
+
+def _with_session(response, session_id):
+    response.set_cookie(SESSION_COOKIE, session_id, httponly=True, samesite="lax")
+    return response
+
+
+async def metrics(request):
+    with flask_app.app.app_context():
+        payload = flask_app.metrics().get_json()
+    payload["generation_gate"] = generation_gate.stats()
+    engine = get_generation_engine(flask_app.model, flask_app.tokenizer) if flask_app.model is not None else None
+    if hasattr(engine, "queue"):  # 모델 서버를 쓰면 큐는 서버 쪽에 있다
+        payload["engine_queue"] = engine.queue.qsize()
+    return JSONResponse(payload)
+
+
+app = Starlette(routes=[
+    Route("/ask", ask, methods=["POST"]),
+    Route("/ask/stream", ask_stream, methods=["POST"]),
+    Route("/metrics", metrics),
+    Mount("/", WSGIMiddleware(flask_app.app)),
+])
@@ -0,0 +1,69 @@
+# 추론 백엔드별 LLM 로드 (app.py, model_server.py, bench_backends.py 가 같이 쓴다)
+#   cuda     : fp16, device_map="auto" (기존 방식)
+#   cpu-int8 : fp32 로 올린 뒤 Linear 층을 동적 int8 양자화 (GPU 없는 현장 서버용)
+#   cpu      : fp32 (양자화 정확도 비교용)
+import os
+import config
+
+MODEL_PATH = "models"
+BACKENDS = ["cuda", "cpu-int8", "cpu"]
+
+
+def _load_cuda(model_path):
+    # torch 가 CUDA 를 초기화하기 전에 장치를 정해야 한다
+    if config.CUDA_DEVICES:
+        os.environ.setdefault("CUDA_VISIBLE_DEVICES", config.CUDA_DEVICES)
+    import torch
+    from transformers import AutoModelForCausalLM
+
+    if not torch.cuda.is_available():
+        raise RuntimeError(
+            "cuda 백엔드를 쓸 수 있는 GPU 가 없습니다 "
+            f"(CUDA_VISIBLE_DEVICES={os.environ.get('CUDA_VISIBLE_DEVICES', '')!r}). "
+            "BLUEAGENT_CUDA_DEVICES 를 확인하거나 BLUEAGENT_BACKEND=cpu-int8 / cpu 를 쓰세요."
+        )
+    return AutoModelForCausalLM.from_pretrained(
+        model_path,
+        torch_dtype=torch.float16,
+        device_map="auto"
+    )
+
+
+def _set_cpu_threads():
+    import torch
+
+    threads = config.CPU_THREADS or os.cpu_count() or 1
+    torch.set_num_threads(threads)
+    try:
+        # 디코딩은 연산 하나하나가 작아서 op 간 병렬보다 op 내부 병렬이 낫다
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # 이미 병렬 작업이 시작된 뒤에는 바꿀 수 없다
+
+
+def _load_cpu(model_path, quantize):
+    import torch
+    from transformers import AutoModelForCausalLM
+
+    _set_cpu_threads()
+    model = AutoModelForCausalLM.from_pretrained(model_path, torch_dtype=torch.float32, low_cpu_mem_usage=True)
+    if quantize:
+        # 가중치는 int8 로, 활성값은 실행 시점에 양자화 (Linear 만, 임베딩/LayerNorm 은 fp32 유지)
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+def load_llm(model_path=MODEL_PATH, backend=None):
+    """→ (model, tokenizer). backend 기본값은 BLUEAGENT_BACKEND."""
+    from transformers import AutoTokenizer
+
+    backend = backend or config.INFERENCE_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"알 수 없는 추론 백엔드: {backend} (가능: {', '.join(BACKENDS)})")
+    if backend == "cuda":
+        model = _load_cuda(model_path)
+    else:
+        model = _load_cpu(model_path, quantize=backend == "cpu-int8")
+    model.eval()
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    return model, tokenizer
@@ -0,0 +1,105 @@
+# 추론 백엔드 벤치마크: intent 별 프롬프트로 단건 지연(p50/p95)과 동시 요청 처리량 비교
+#   python bench_backends.py --backends cuda cpu-int8
+#   BLUEAGENT_CPU_THREADS=8 python bench_backends.py --backends cpu-int8 --concurrency 4
+# 응답 캐시는 끄고 측정한다. cpu / cpu-int8 은 fp32 로 먼저 올리므로 모델 크기의 4배 정도 RAM 이 필요하다.
+import os
+
+os.environ["BLUEAGENT_RESPONSE_CACHE_SIZE"] = "0"
+os.environ["BLUEAGENT_RESPONSE_CACHE_PATH"] = ""
+
+import argparse
+import gc
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from backends import BACKENDS, MODEL_PATH, load_llm
+from generators import (
+    generate_intent_from_llm,
+    generate_report_from_question,
+    generate_rag_response,
+    generate_response_from_query_with_history,
+    generate_stress_reason_from_data,
+    warmup_prefix_cache,
+)
+
+REPORT_SUMMARY = (
+    "- 김민지 (2025-06-01 ~ 2025-06-07, 7일):\n"
+    "  PPG: 평균 0.92, 중앙값 0.91, 최소 0.80, 최대 1.05, 표준편차 0.06, 추세 유지(+0.001/일)\n"
+    "  HRV: 평균 41.20, 중앙값 40.00, 최소 35.00, 최대 49.00, 표준편차 4.10, 추세 하락(-0.800/일)\n"
+    "  스트레스: 평균 72.50, 중앙값 70.00, 최소 60.00, 최대 88.00, 표준편차 8.30, 추세 상승(+1.900/일)"
+)
+RAG_DOCS = [
+    "PPG(광용적맥파)는 혈류량 변화를 빛으로 측정한 신호이며 심박과 혈관 상태를 반영합니다.",
+    "HRV(심박변이도)는 심박 간격의 변동으로, 값이 낮을수록 스트레스가 높은 경향이 있습니다.",
+]
+
+# intent → (model, tokenizer) 를 받아 한 번 생성하는 함수
+WORKLOADS = {
+    "intent": lambda m, t: generate_intent_from_llm("김민지 요즘 좀 어때 보여?", m, t),
+    "report": lambda m, t: generate_report_from_question("김민지 최근 7일 상태 요약해줘", m, t, REPORT_SUMMARY),
+    "rag": lambda m, t: generate_rag_response("ppg 120이면 높은 편이야?", RAG_DOCS, m, t),
+    "stress_reason": lambda m, t: generate_stress_reason_from_data(
+        "김민지 왜 stress가 높아?", m, t, "김민지", [], hrv_values=[45.0, 41.0, 36.0], ppg_stds=[0.05, 0.07, 0.11]
+    ),
+    "filter_rag": lambda m, t: generate_response_from_query_with_history(
+        "stress 90 이상인 사람 알려줘", [("김민지", "2025-06-03", 92.0), ("이지훈", "2025-06-05", 95.0)], [], m, t
+    ),
+}
+
+
+def measure(model, tokenizer, fn, repeat, concurrency):
+    fn(model, tokenizer)  # 워밍업
+    latencies = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(model, tokenizer)
+        latencies.append(time.perf_counter() - t0)
+    latencies.sort()
+
+    # 동시 요청: 엔진이 한 배치로 묶어 처리한다
+    total = repeat * concurrency
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(lambda _: fn(model, tokenizer), range(total)))
+    throughput = total / (time.perf_counter() - t0)
+
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    return statistics.median(latencies) * 1000, p95 * 1000, throughput
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", nargs="+", default=["cuda", "cpu-int8"], choices=BACKENDS)
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--intents", nargs="+", default=list(WORKLOADS), choices=list(WORKLOADS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    print(f"{'backend':<10}{'intent':<15}{'load(s)':>9}{'p50(ms)':>10}{'p95(ms)':>10}{'req/s':>8}")
+    for backend in args.backends:
+        t0 = time.perf_counter()
+        model, tokenizer = load_llm(args.model, backend)
+        warmup_prefix_cache(model, tokenizer)
+        load = time.perf_counter() - t0
+        for intent in args.intents:
+            p50, p95, rps = measure(model, tokenizer, WORKLOADS[intent], args.repeat, args.concurrency)
+            print(f"{backend:<10}{intent:<15}{load:>9.1f}{p50:>10.0f}{p95:>10.0f}{rps:>8.2f}")
+
+        # 다음 백엔드를 올리기 전에 엔진 스레드를 멈추고 모델 메모리 정리
+        from engine import release_engine
+
+        release_engine(model)
+        del model, tokenizer
+        gc.collect()
+        try:
+            import torch
+
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except ImportError:
+            pass
+
+
+if __name__ == "__main__":
+    main()
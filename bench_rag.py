@@ -0,0 +1,68 @@
+# RAG 인덱스 백엔드 벤치마크: flat(정확 검색) 대비 ivf/hnsw 의 recall@k 와 질의 지연 비교
+#   python bench_rag.py                      # rag_corpus.json 임베딩 사용
+#   python bench_rag.py --synthetic 200000   # 대용량 코퍼스를 가정한 무작위 벡터
+import argparse
+import json
+import time
+import numpy as np
+import faiss
+from rag_utils import make_index, normalize_embeddings, load_embedding_model
+
+
+def load_vectors(args):
+    if args.synthetic:
+        rng = np.random.default_rng(0)
+        # 군집 구조가 있는 합성 임베딩 (실제 문장 임베딩과 비슷하게)
+        centers = rng.normal(size=(max(1, args.synthetic // 500), args.dim))
+        labels = rng.integers(0, len(centers), size=args.synthetic)
+        data = centers[labels] + 0.3 * rng.normal(size=(args.synthetic, args.dim))
+        return normalize_embeddings(data)
+    with open(args.corpus, "r", encoding="utf-8") as f:
+        corpus = json.load(f)
+    embedder = load_embedding_model()
+    return normalize_embeddings(embedder.encode(corpus, convert_to_numpy=True))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", default="rag_corpus.json")
+    parser.add_argument("--synthetic", type=int, default=0)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=3)
+    args = parser.parse_args()
+
+    data = load_vectors(args)
+    rng = np.random.default_rng(1)
+    queries = data[rng.choice(len(data), size=min(args.queries, len(data)), replace=False)]
+    queries = normalize_embeddings(queries + 0.05 * rng.normal(size=queries.shape))
+    k = min(args.k, len(data))
+
+    print(f"corpus={len(data)} dim={data.shape[1]} queries={len(queries)} k={k}")
+    print(f"{'backend':<8}{'build(s)':>10}{'recall@k':>10}{'ms/query':>10}  params")
+    truth = None
+    for backend in ["flat", "ivf", "hnsw"]:
+        t0 = time.perf_counter()
+        index = make_index(data, backend)
+        build = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        _, I = index.search(queries, k)
+        latency = (time.perf_counter() - t0) * 1000 / len(queries)
+
+        if truth is None:
+            truth = I
+        hits = sum(len(set(a) & set(b)) for a, b in zip(I.tolist(), truth.tolist()))
+        recall = hits / truth.size
+
+        if isinstance(index, faiss.IndexIVF):
+            params = f"nlist={index.nlist} nprobe={index.nprobe}"
+        elif isinstance(index, faiss.IndexHNSW):
+            params = f"M={index.hnsw.nb_neighbors(1)} efSearch={index.hnsw.efSearch}"
+        else:
+            params = "exact"
+        print(f"{backend:<8}{build:>10.2f}{recall:>10.3f}{latency:>10.3f}  {params}")
+
+
+if __name__ == "__main__":
+    main()
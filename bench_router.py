@@ -0,0 +1,102 @@
+# intent 라우터 벤치마크: 예전 정규식 순차 검사 + 이름 선형 탐색과 결과/지연 비교
+# (안정/불안정 + 사람 질문은 filter_rag, 이름 + 단일 통계 질문은 report 로 라우터가 의도적으로 바로 보내므로 legacy 와 다르게 나온다.
+#  legacy 의 stress_reason 정규식은 "스트레스" 를 찾지만 질문은 이미 "stress" 로 정규화되어 있어 한 번도 맞지 않았다)
+#   python bench_router.py                  # intent_examples.jsonl + 합성 이름 5000명
+#   python bench_router.py --names 20000
+import argparse
+import json
+import random
+import re
+import time
+from router import IntentRouter
+from util import normalize_column_name
+
+
+# 비교 기준: 예전 app.classify_question / extract_name_from_question
+def legacy_classify(question, candidate_names):
+    if re.search(r"(최대|최소|중앙값|요약|통계)", question):
+        return "report"
+    if re.search(r"(그래프|추이|그려줘|시계열|선 그래프)", question):
+        return "visual"
+    if re.search(r"(이상|이하|보다 큰|보다 낮은|조건에 맞는)", question) and re.search(r"(사람|누구|사용자|이름|찾아|있어)", question):
+        return "filter_rag"
+    if re.search(r"(높은거야|낮은거야|기준|정상|의미|무슨 뜻|정의|어때|맞아|괜찮아|높은 편|낮은 편)", question):
+        return "rag"
+    if re.match(r"^(안녕|ㅎ+|하+|헐|뭐야|ㅋㅋ+|ㅎㅎ+|테스트|hi|hello)$", question.strip(), re.IGNORECASE):
+        return "chitchat"
+    if any(name == question.strip() for name in candidate_names):
+        return "name_only"
+    if re.search(r"(왜|이유|원인).*스트레스.*(높|많|낮|작)", question):
+        return "stress_reason"
+    return "ambiguous"
+
+
+def legacy_name(question, candidate_names):
+    for name in candidate_names:
+        if name in question:
+            return name
+    return None
+
+
+def synthetic_names(n, seed=0):
+    rng = random.Random(seed)
+    family = "김이박최정강조윤장임한오서신권황안송류홍"
+    syllables = "민지훈하정주연해름수영서준도현예은성우채원가람나래"
+    names = set()
+    while len(names) < n:
+        names.add(rng.choice(family) + "".join(rng.choice(syllables) for _ in range(rng.choice((2, 3)))))
+    return sorted(names)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--examples", default="intent_examples.jsonl")
+    parser.add_argument("--names", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with open(args.examples, "r", encoding="utf-8") as f:
+        examples = [json.loads(line) for line in f if line.strip()]
+    # 실제 서비스처럼 컬럼명 정규화를 거친 질문으로 비교
+    questions = [normalize_column_name(e["question"])[0] for e in examples]
+    labels = [e["intent"] for e in examples]
+
+    real_names = ["김민지", "이지훈", "김하정", "박주연", "박해름"]
+    names = real_names + [n for n in synthetic_names(args.names) if n not in real_names]
+    random.Random(1).shuffle(names)
+    router = IntentRouter(names)
+
+    mismatches = 0
+    correct = 0
+    ambiguous = 0
+    for q, label in zip(questions, labels):
+        new = router.route(q)
+        old = (legacy_classify(q, names), legacy_name(q, names))
+        if new != old:
+            mismatches += 1
+            print(f"불일치: {q!r} router={new} legacy={old}")
+        correct += new[0] == label
+        ambiguous += new[0] == "ambiguous"
+
+    def timed(fn):
+        t0 = time.perf_counter()
+        for _ in range(args.repeat):
+            for q in questions:
+                fn(q)
+        return (time.perf_counter() - t0) * 1e6 / (args.repeat * len(questions))
+
+    t0 = time.perf_counter()
+    IntentRouter(names)
+    build = (time.perf_counter() - t0) * 1000
+    legacy_us = timed(lambda q: (legacy_classify(q, names), legacy_name(q, names)))
+    router_us = timed(router.route)
+
+    print(f"questions={len(questions)} names={len(names)}")
+    print(f"legacy 일치: {len(questions) - mismatches}/{len(questions)}")
+    print(f"라벨 정확도: {correct / len(questions):.3f}  ambiguous(LLM fallback) 비율: {ambiguous / len(questions):.3f}")
+    print(f"router 생성: {build:.1f} ms")
+    print(f"legacy: {legacy_us:.1f} us/질문, router: {router_us:.1f} us/질문")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import sqlite3
+import time
+import threading
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    """크기 제한(LRU)과 선택적 TTL 을 가진 스레드 안전 메모리 캐시."""
+
+    def __init__(self, maxsize=128, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            item = self.data.get(key)
+            if item is not None:
+                value, expires = item
+                if expires is None or expires > time.monotonic():
+                    self.data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self.lock:
+            self.data[key] = (value, expires)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def __len__(self):
+        return len(self.data)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self.data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+class PersistentLRUCache(LRUCache):
+    """
+    메모리 LRU 앞단 + SQLite 파일 뒷단 캐시 (재시작 후에도 유지).
+    값은 문자열만 저장한다. path 가 없으면 LRUCache 와 같다.
+    """
+
+    PRUNE_EVERY = 100
+
+    def __init__(self, maxsize=128, ttl=None, path=None, disk_maxsize=None):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self.disk_maxsize = disk_maxsize or maxsize * 10
+        self.disk_hits = 0
+        self.writes = 0
+        self.db = None
+        if path:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created REAL NOT NULL
+            )
+            """)
+            self.db.commit()
+        self.db_lock = threading.Lock()
+
+    def get(self, key, default=None):
+        value = super().get(key, _MISSING)
+        if value is not _MISSING or self.db is None:
+            return default if value is _MISSING else value
+        with self.db_lock:
+            row = self.db.execute("SELECT value, created FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None or (self.ttl and row[1] + self.ttl < time.time()):
+            return default
+        # 디스크 적중: 메모리로 올리고 미스 집계를 적중으로 바꾼다
+        with self.lock:
+            self.misses -= 1
+            self.hits += 1
+            self.disk_hits += 1
+        super().set(key, row[0])
+        return row[0]
+
+    def set(self, key, value):
+        super().set(key, value)
+        if self.db is None:
+            return
+        with self.db_lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO cache (key, value, created) VALUES (?, ?, ?)",
+                (key, value, time.time()),
+            )
+            self.writes += 1
+            if self.writes % self.PRUNE_EVERY == 0:
+                # 오래된 항목부터 잘라 디스크 크기도 제한
+                self.db.execute(
+                    "DELETE FROM cache WHERE key NOT IN "
+                    "(SELECT key FROM cache ORDER BY created DESC LIMIT ?)",
+                    (self.disk_maxsize,),
+                )
+            self.db.commit()
+
+    def clear(self):
+        super().clear()
+        if self.db is not None:
+            with self.db_lock:
+                self.db.execute("DELETE FROM cache")
+                self.db.commit()
+
+    def stats(self):
+        stats = super().stats()
+        stats["disk_hits"] = self.disk_hits
+        if self.db is not None:
+            with self.db_lock:
+                stats["disk_size"] = self.db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        return stats
+
@@ -0,0 +1,42 @@
+import io
+import base64
+import threading
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+# pyplot 전역 상태를 쓰지 않는 객체지향 Agg 렌더러.
+# Figure 는 스레드마다 하나씩 만들어 재사용하므로 동시 요청에서도 서로 섞이지 않는다.
+_local = threading.local()
+
+LABELS = {"ppg": "PPG", "hrv": "HRV", "stress": "Stress"}
+
+
+def _get_figure():
+    fig = getattr(_local, "figure", None)
+    if fig is None:
+        fig = Figure(figsize=(10, 6))
+        FigureCanvasAgg(fig)
+        _local.figure = fig
+    else:
+        fig.clear()
+    return fig
+
+
+def render_timeseries(dates, values, plot_target="ppg", title=None):
+    """날짜별 값을 선 그래프로 그려 base64 PNG 문자열로 돌려준다."""
+    fig = _get_figure()
+    ax = fig.add_subplot(111)
+    ax.plot(dates, values, marker="o")
+    ax.set_xlabel("date")
+    ax.set_ylabel(LABELS.get(plot_target, plot_target))
+    if title:
+        ax.set_title(title)
+    ax.grid(True, alpha=0.3)
+    for label in ax.get_xticklabels():
+        label.set_rotation(45)
+        label.set_horizontalalignment("right")
+    fig.tight_layout()
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", bbox_inches="tight")
+    return base64.b64encode(buffer.getvalue()).decode("utf-8")
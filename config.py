@@ -0,0 +1,67 @@
+import os
+
+# 환경 변수로 덮어쓸 수 있는 서비스 설정값
+
+# 생성 엔진 (continuous batching)
+ENGINE_MAX_BATCH_SIZE = int(os.environ.get("BLUEAGENT_MAX_BATCH_SIZE", "8"))
+ENGINE_MAX_WAIT_MS = float(os.environ.get("BLUEAGENT_MAX_WAIT_MS", "10"))
+
+# 그래프: 기본은 결정적 렌더러, 1 이면 예전처럼 LLM 이 matplotlib 코드를 생성
+VISUAL_CODEGEN = os.environ.get("BLUEAGENT_VISUAL_CODEGEN", "0") == "1"
+
+# 렌더링된 그래프 캐시
+CHART_CACHE_SIZE = int(os.environ.get("BLUEAGENT_CHART_CACHE_SIZE", "256"))
+CHART_CACHE_TTL = float(os.environ.get("BLUEAGENT_CHART_CACHE_TTL", "600"))
+
+# RAG 검색 인덱스: flat(정확) / ivf / hnsw, 모두 정규화 임베딩의 inner product
+RAG_BACKEND = os.environ.get("BLUEAGENT_RAG_BACKEND", "flat")
+RAG_MIN_SCORE = float(os.environ.get("BLUEAGENT_RAG_MIN_SCORE", "0.35"))  # 코사인 유사도 하한
+RAG_TARGET_RECALL = float(os.environ.get("BLUEAGENT_RAG_TARGET_RECALL", "0.95"))
+RAG_IVF_NLIST = int(os.environ.get("BLUEAGENT_RAG_IVF_NLIST", "0"))  # 0 이면 코퍼스 크기로 결정
+RAG_HNSW_M = int(os.environ.get("BLUEAGENT_RAG_HNSW_M", "32"))
+
+# 질의 임베딩 캐시 / 마이크로 배치
+EMBED_CACHE_SIZE = int(os.environ.get("BLUEAGENT_EMBED_CACHE_SIZE", "1024"))
+EMBED_MAX_WAIT_MS = float(os.environ.get("BLUEAGENT_EMBED_MAX_WAIT_MS", "5"))
+
+# report 프롬프트 토큰 상한 (요약 통계가 넘치면 뒤쪽 줄부터 생략)
+REPORT_MAX_PROMPT_TOKENS = int(os.environ.get("BLUEAGENT_REPORT_MAX_PROMPT_TOKENS", "768"))
+
+# LLM 응답 캐시 (greedy 디코딩이라 같은 프롬프트 + 같은 데이터 버전이면 결과가 같다)
+RESPONSE_CACHE_SIZE = int(os.environ.get("BLUEAGENT_RESPONSE_CACHE_SIZE", "512"))
+RESPONSE_CACHE_TTL = float(os.environ.get("BLUEAGENT_RESPONSE_CACHE_TTL", "0")) or None  # 0 이면 만료 없음
+RESPONSE_CACHE_PATH = os.environ.get("BLUEAGENT_RESPONSE_CACHE_PATH", "")  # 디스크 보존 파일 (예: response_cache.db). 빈 값이면 메모리만
+
+# ASGI 서빙 모드 (uvicorn asgi:app)
+ASGI_CPU_WORKERS = int(os.environ.get("BLUEAGENT_ASGI_CPU_WORKERS", "4"))  # DB / 그래프 / 통계
+ASGI_MAX_PENDING_GENERATIONS = int(os.environ.get("BLUEAGENT_ASGI_MAX_PENDING_GENERATIONS", "32"))
+ASGI_RETRY_AFTER = int(os.environ.get("BLUEAGENT_ASGI_RETRY_AFTER", "5"))  # 503 응답의 Retry-After (초)
+
+# 세션별 대화 기록
+HISTORY_MAX_TURNS = int(os.environ.get("BLUEAGENT_HISTORY_MAX_TURNS", "20"))  # 세션당 보관 (ring buffer)
+HISTORY_PROMPT_TURNS = int(os.environ.get("BLUEAGENT_HISTORY_PROMPT_TURNS", "6"))  # 프롬프트에 넣는 최대 턴 수
+HISTORY_MAX_TOKENS = int(os.environ.get("BLUEAGENT_HISTORY_MAX_TOKENS", "256"))  # 프롬프트에 넣는 기록의 토큰 상한
+HISTORY_IDLE_SECONDS = float(os.environ.get("BLUEAGENT_HISTORY_IDLE_SECONDS", "1800"))
+HISTORY_MAX_SESSIONS = int(os.environ.get("BLUEAGENT_HISTORY_MAX_SESSIONS", "1000"))
+HISTORY_DB_PATH = os.environ.get("BLUEAGENT_HISTORY_DB_PATH", "")  # 지정하면 재시작 후에도 유지
+
+# ambiguous 질문용 로컬 intent 분류기 (임베딩 nearest-centroid), 확신이 낮을 때만 LLM 사용
+INTENT_EXAMPLES_PATH = os.environ.get("BLUEAGENT_INTENT_EXAMPLES_PATH", "intent_examples.jsonl")
+# 재학습용 질문 기록 (예: intent_log.jsonl). 질문 원문과 사람 이름이 남으므로 기본은 기록하지 않는다
+INTENT_LOG_PATH = os.environ.get("BLUEAGENT_INTENT_LOG_PATH", "")
+INTENT_MIN_SCORE = float(os.environ.get("BLUEAGENT_INTENT_MIN_SCORE", "0.55"))  # 가장 가까운 centroid 코사인 유사도
+INTENT_MIN_MARGIN = float(os.environ.get("BLUEAGENT_INTENT_MIN_MARGIN", "0.05"))  # 1, 2위 유사도 차이
+
+# 시작 방식: 0(기본)이면 모델/RAG 를 백그라운드에서 올리고 바로 요청을 받는다, 1 이면 예전처럼 다 올린 뒤 시작
+STARTUP_BLOCKING = os.environ.get("BLUEAGENT_STARTUP_BLOCKING", "0") == "1"
+
+# 모델 서버: 지정하면 웹 워커는 모델을 직접 올리지 않고 이 주소의 model_server.py 에 생성/임베딩을 요청한다
+MODEL_SERVER_ADDRESS = os.environ.get("BLUEAGENT_MODEL_SERVER", "")  # "127.0.0.1:6100" 또는 유닉스 소켓 경로
+# 연결 인증 키 (pickle 기반 RPC 라 키를 아는 쪽은 서버에서 코드를 실행할 수 있다). 기본값 없음: 서버/클라이언트 모두 설정 필수
+MODEL_SERVER_AUTHKEY = os.environ.get("BLUEAGENT_MODEL_SERVER_AUTHKEY", "").encode()
+MODEL_SERVER_POOL_SIZE = int(os.environ.get("BLUEAGENT_MODEL_SERVER_POOL_SIZE", "16"))  # 워커당 유지할 연결 수
+
+# 추론 백엔드: cuda(기본, fp16) / cpu-int8(동적 int8 양자화) / cpu(fp32)
+INFERENCE_BACKEND = os.environ.get("BLUEAGENT_BACKEND", "cuda")
+CUDA_DEVICES = os.environ.get("BLUEAGENT_CUDA_DEVICES", "")  # 설정하면 CUDA_VISIBLE_DEVICES 로 넘긴다 (비우면 그대로 둔다)
+CPU_THREADS = int(os.environ.get("BLUEAGENT_CPU_THREADS", "0"))  # 0 이면 코어 수
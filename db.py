@@ -1,26 +1,453 @@
 import sqlite3
 import json
+import math
+import queue
+import threading
+from array import array
+from contextlib import contextmanager
 
 DB_PATH = "user_data.db"  # SQLite DB 파일 경로
+POOL_SIZE = 8
+POOL_TIMEOUT = 30  # 연결을 빌리기 위해 기다리는 최대 시간(초)
 
-def execute_sql_and_fetch(sql: str):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute(sql)
-    rows = cursor.fetchall()
-    conn.close()
-    return rows
+# 연결마다 적용하는 PRAGMA (WAL 이면 읽기끼리, 읽기와 쓰기가 서로 막지 않는다)
+PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA temp_store=MEMORY",
+]
 
-def fetch_and_compute_ppg_avg():
-    conn = sqlite3.connect("user_data.db")
-    cursor = conn.cursor()
 
-    cursor.execute("SELECT name, date, ppg_json FROM user_data")
-    rows = cursor.fetchall()
+def prepare_connection(conn):
+    """PRAGMA 적용. SQLite 가 수학 함수 없이 빌드됐으면 트리거가 쓰는 sqrt 를 등록한다."""
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    try:
+        conn.execute("SELECT sqrt(1)")
+    except sqlite3.OperationalError:
+        conn.create_function("sqrt", 1, lambda v: None if v is None else math.sqrt(v), deterministic=True)
+    return conn
 
-    for name, date, ppg_json in rows:
-        ppg_list = json.loads(ppg_json)
-        avg = sum(ppg_list) / len(ppg_list)
-        print(f"{name} ({date}) → PPG 평균: {avg:.2f}")
 
-    conn.close()
\ No newline at end of file
+class ConnectionPool:
+    """
+    요청마다 빌려 쓰고 돌려주는 SQLite 연결 풀.
+    연결별 prepared statement 캐시(cached_statements)가 유지되므로 같은 쿼리는 다시 파싱하지 않는다.
+    """
+
+    def __init__(self, path=DB_PATH, size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.idle = queue.LifoQueue()
+        self.created = 0
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30, cached_statements=256)
+        return prepare_connection(conn)
+
+    def _acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            if self.created < self.size:
+                self.created += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self.created -= 1
+                    raise
+        try:
+            return self.idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError("DB 연결을 얻지 못했습니다 (연결 풀 대기 시간 초과).") from None
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self.idle.put(conn)
+
+
+pool = ConnectionPool()
+
+
+def connection():
+    return pool.connection()
+
+
+class PooledCursor:
+    """
+    요청 처리용 읽기 커서. execute 마다 풀에서 연결을 빌려 결과를 모두 읽고 바로 돌려준다.
+    LLM 생성처럼 오래 걸리는 단계 동안 연결을 붙잡지 않고, 조회가 겹쳐도 풀이 바닥나지 않는다.
+    """
+
+    def __init__(self, connection_pool=None):
+        self.pool = connection_pool or pool
+        self.rows = []
+
+    def execute(self, sql, params=()):
+        with self.pool.connection() as conn:
+            self.rows = conn.execute(sql, params).fetchall()
+        return self
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def fetchone(self):
+        return self.rows.pop(0) if self.rows else None
+
+
+def pooled_cursor():
+    return PooledCursor()
+
+
+# 사용자별 데이터 버전: user_data 가 바뀔 때마다 트리거로 증가 (캐시 무효화용)
+VERSION_SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_data_version (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE TRIGGER IF NOT EXISTS user_data_version_insert AFTER INSERT ON user_data
+BEGIN
+    INSERT INTO user_data_version (name, version) VALUES (NEW.name, 1)
+    ON CONFLICT(name) DO UPDATE SET version = version + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS user_data_version_update AFTER UPDATE ON user_data
+BEGIN
+    INSERT INTO user_data_version (name, version) VALUES (OLD.name, 1)
+    ON CONFLICT(name) DO UPDATE SET version = version + 1;
+    INSERT INTO user_data_version (name, version) VALUES (NEW.name, 1)
+    ON CONFLICT(name) DO UPDATE SET version = version + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS user_data_version_delete AFTER DELETE ON user_data
+BEGIN
+    INSERT INTO user_data_version (name, version) VALUES (OLD.name, 1)
+    ON CONFLICT(name) DO UPDATE SET version = version + 1;
+END;
+"""
+
+
+# PPG 저장 형식: ppg_json(원본) + float32 바이너리 + 행별 개수/평균/표준편차(모표준편차)
+# 보조 컬럼은 INSERT 때 함께 넣고, 이후 ppg_json 이 바뀌면 트리거가 통계를 다시 계산한다.
+# 트리거는 float32 로 묶을 수 없으므로, 같은 UPDATE 에서 ppg_blob 을 새로 주지 않았으면 NULL 로 비우고
+# 읽는 쪽(ppg_values)은 ppg_json 으로 대신 읽는다. 다음 migrate_schema 가 비운 blob 을 다시 채운다.
+PPG_COLUMNS = [
+    ("ppg_blob", "BLOB"),
+    ("ppg_count", "INTEGER"),
+    ("ppg_mean", "REAL"),
+    ("ppg_std", "REAL"),
+]
+
+PPG_COLUMNS_TRIGGER = """
+DROP TRIGGER IF EXISTS user_data_ppg_columns;
+CREATE TRIGGER user_data_ppg_columns AFTER UPDATE OF ppg_json ON user_data
+BEGIN
+    UPDATE user_data SET (ppg_count, ppg_mean, ppg_std) = (
+        SELECT COUNT(j.value), AVG(j.value), sqrt(MAX(AVG(j.value * j.value) - AVG(j.value) * AVG(j.value), 0))
+        FROM json_each(CASE WHEN json_valid(NEW.ppg_json) THEN NEW.ppg_json ELSE '[]' END) j
+    ), ppg_blob = CASE WHEN NEW.ppg_blob IS OLD.ppg_blob THEN NULL ELSE NEW.ppg_blob END
+    WHERE id = NEW.id;
+END;
+"""
+
+
+def pack_ppg(values):
+    return array("f", values).tobytes()
+
+
+def unpack_ppg(blob):
+    values = array("f")
+    values.frombytes(blob)
+    return values.tolist()
+
+
+def ppg_values(raw):
+    """ppg_blob(float32) / ppg_json 문자열 / 리스트 / 숫자 → float 리스트 (읽을 수 없으면 빈 리스트)."""
+    if isinstance(raw, (bytes, memoryview)):
+        return unpack_ppg(bytes(raw))
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except json.JSONDecodeError:
+            return []
+    if isinstance(raw, (int, float)):
+        return [float(raw)]
+    return [float(v) for v in raw] if isinstance(raw, list) else []
+
+
+def ppg_stats(values):
+    """(개수, 평균, 모표준편차). 값이 없으면 (0, None, None)."""
+    n = len(values)
+    if n == 0:
+        return 0, None, None
+    mean = sum(values) / n
+    var = sum((v - mean) ** 2 for v in values) / n
+    return n, mean, math.sqrt(var)
+
+
+def ppg_columns(values):
+    """INSERT 시 ppg_json 과 함께 넣을 (ppg_blob, ppg_count, ppg_mean, ppg_std)."""
+    return (pack_ppg(values),) + ppg_stats(values)
+
+
+def migrate_unique_name_date(conn):
+    """
+    (name, date) 는 사람당 하루 한 행: UNIQUE 인덱스가 아직 없을 때 한 번만,
+    중복 행은 먼저 들어온 행만 남기고 지운 뒤 인덱스를 만든다. 지운 행 수를 돌려준다.
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'uq_user_data_name_date'"
+    ).fetchone()
+    if exists:
+        return 0
+    removed = conn.execute("""
+        DELETE FROM user_data WHERE id NOT IN (SELECT MIN(id) FROM user_data GROUP BY name, date)
+    """).rowcount
+    if removed:
+        print(f"migrate: user_data 의 중복 (name, date) 행 {removed}개를 지웠습니다.")
+    conn.execute("DROP INDEX IF EXISTS idx_user_data_name_date")
+    conn.execute("CREATE UNIQUE INDEX uq_user_data_name_date ON user_data (name, date)")
+    return removed
+
+
+def migrate_schema(conn):
+    migrate_unique_name_date(conn)
+
+    # PPG 보조 컬럼 추가
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(user_data)")}
+    for column, kind in PPG_COLUMNS:
+        if column not in existing:
+            conn.execute(f"ALTER TABLE user_data ADD COLUMN {column} {kind}")
+    conn.executescript(PPG_COLUMNS_TRIGGER)
+
+    # 보조 컬럼이 비어 있는 행(예전 데이터, 다른 경로로 들어온 행, 트리거가 blob 을 비운 행)을 채운다
+    rows = conn.execute(
+        "SELECT id, ppg_json FROM user_data WHERE ppg_count IS NULL OR ppg_blob IS NULL"
+    ).fetchall()
+    updates = [ppg_columns(ppg_values(ppg_json or "[]")) + (row_id,) for row_id, ppg_json in rows]
+    if updates:
+        conn.executemany(
+            "UPDATE user_data SET ppg_blob = ?, ppg_count = ?, ppg_mean = ?, ppg_std = ? WHERE id = ?",
+            updates,
+        )
+
+
+# 사용자별 일/월 롤업: 지표마다 개수, 합, 제곱합, 최소, 최대
+# hrv/stress 는 행 단위, ppg 는 샘플 단위로 집계한다
+ROLLUP_METRICS = ["hrv", "stress", "ppg"]
+ROLLUP_FIELDS = ["n", "sum", "sumsq", "min", "max"]
+ROLLUP_TABLES = {
+    # 테이블: (키 컬럼, user_data 행 {t} 에서 키를 만드는 식)
+    "user_daily_rollup": ("day", "{t}.date"),
+    "user_monthly_rollup": ("month", "substr({t}.date, 1, 7)"),
+}
+_ROLLUP_COLUMNS = ["rows"] + [f"{m}_{f}" for m in ROLLUP_METRICS for f in ROLLUP_FIELDS]
+_PPG_VALUES = "json_each(CASE WHEN json_valid({t}.ppg_json) THEN {t}.ppg_json ELSE '[]' END)"
+_PPG_AGGS = "COUNT(j.value), TOTAL(j.value), TOTAL(j.value * j.value), MIN(j.value), MAX(j.value)"
+
+
+def _row_aggs(t):
+    aggs = []
+    for m in ["hrv", "stress"]:
+        aggs += [f"COUNT({t}.{m})", f"TOTAL({t}.{m})", f"TOTAL({t}.{m} * {t}.{m})", f"MIN({t}.{m})", f"MAX({t}.{m})"]
+    return aggs
+
+
+def _rollup_table_sql(table, key):
+    columns = ",\n    ".join(
+        ["rows INTEGER NOT NULL DEFAULT 0"]
+        + [f"{m}_{f} {'INTEGER NOT NULL DEFAULT 0' if f == 'n' else 'REAL'}" for m in ROLLUP_METRICS for f in ROLLUP_FIELDS]
+    )
+    return f"""
+CREATE TABLE IF NOT EXISTS {table} (
+    name TEXT NOT NULL,
+    {key} TEXT NOT NULL,
+    {columns},
+    PRIMARY KEY (name, {key})
+);"""
+
+
+def _rollup_select(key_expr, where="1"):
+    # (name, key) 별 집계. ppg 는 json_each 로 샘플을 펼쳐 따로 집계한 뒤 붙인다.
+    # key_expr / where 는 user_data 별칭 자리에 {t} 를 쓴다.
+    key, cond = key_expr.format(t="u"), where.format(t="u")
+    row_aggs = ", ".join(f"{agg} AS c{i}" for i, agg in enumerate(_row_aggs("u")))
+    return f"""
+SELECT a.name, a.k, a.rows, {", ".join(f"a.c{i}" for i in range(10))},
+       IFNULL(p.n, 0), IFNULL(p.s, 0), IFNULL(p.ss, 0), p.mn, p.mx
+FROM (
+    SELECT u.name, {key} AS k, COUNT(*) AS rows, {row_aggs}
+    FROM user_data u WHERE {cond} GROUP BY u.name, k
+) a LEFT JOIN (
+    SELECT u.name, {key} AS k,
+           COUNT(j.value) AS n, TOTAL(j.value) AS s, TOTAL(j.value * j.value) AS ss, MIN(j.value) AS mn, MAX(j.value) AS mx
+    FROM user_data u, {_PPG_VALUES.format(t="u")} j WHERE {cond} GROUP BY u.name, k
+) p ON p.name = a.name AND p.k = a.k"""
+
+
+def _add_row(table, key, key_expr, row):
+    # 행 하나의 값을 (이름, 기간) 롤업에 더한다. 최소/최대는 합쳐서 갱신
+    cols = ", ".join(_ROLLUP_COLUMNS)
+    row_values = ", ".join(
+        f"{row}.{m} IS NOT NULL, IFNULL({row}.{m}, 0), IFNULL({row}.{m} * {row}.{m}, 0), {row}.{m}, {row}.{m}"
+        for m in ["hrv", "stress"]
+    )
+    updates = ["rows = rows + excluded.rows"]
+    for m in ROLLUP_METRICS:
+        for f in ["n", "sum", "sumsq"]:
+            updates.append(f"{m}_{f} = {m}_{f} + excluded.{m}_{f}")
+        updates.append(f"{m}_min = COALESCE(MIN({m}_min, excluded.{m}_min), {m}_min, excluded.{m}_min)")
+        updates.append(f"{m}_max = COALESCE(MAX({m}_max, excluded.{m}_max), {m}_max, excluded.{m}_max)")
+    return f"""
+    INSERT INTO {table} (name, {key}, {cols})
+    SELECT {row}.name, {key_expr.format(t=row)}, 1, {row_values}, {_PPG_AGGS}
+    FROM {_PPG_VALUES.format(t=row)} j
+    WHERE true
+    ON CONFLICT(name, {key}) DO UPDATE SET {", ".join(updates)};"""
+
+
+def _remove_row(table, key, key_expr, row):
+    # 행 하나의 값을 롤업에서 뺀다. 최소/최대는 빼기로 되돌릴 수 없으므로
+    # 빠진 값이 그 기간의 최소/최대였던 지표만 원본에서 다시 구한다.
+    # (AFTER 트리거라 원본에는 이미 바뀐 뒤의 행이 들어 있다)
+    group = f"name = {row}.name AND {key} = {key_expr.format(t=row)}"
+    source = f"u.name = {row}.name AND {key_expr.format(t='u')} = {key_expr.format(t=row)}"
+    row_updates = ", ".join(
+        f"{m}_n = {m}_n - ({row}.{m} IS NOT NULL), {m}_sum = {m}_sum - IFNULL({row}.{m}, 0), "
+        f"{m}_sumsq = {m}_sumsq - IFNULL({row}.{m} * {row}.{m}, 0)"
+        for m in ["hrv", "stress"]
+    )
+    sql = f"""
+    UPDATE {table} SET rows = rows - 1, {row_updates},
+        (ppg_n, ppg_sum, ppg_sumsq) = (
+            SELECT ppg_n - COUNT(j.value), ppg_sum - TOTAL(j.value), ppg_sumsq - TOTAL(j.value * j.value)
+            FROM {_PPG_VALUES.format(t=row)} j
+        )
+    WHERE {group};"""
+    for m in ["hrv", "stress"]:
+        sql += f"""
+    UPDATE {table} SET ({m}_min, {m}_max) = (SELECT MIN(u.{m}), MAX(u.{m}) FROM user_data u WHERE {source})
+    WHERE {group} AND {row}.{m} IN ({m}_min, {m}_max);"""
+    sql += f"""
+    UPDATE {table} SET (ppg_min, ppg_max) = (
+        SELECT MIN(j.value), MAX(j.value) FROM user_data u, {_PPG_VALUES.format(t="u")} j WHERE {source}
+    )
+    WHERE {group} AND EXISTS (SELECT 1 FROM {_PPG_VALUES.format(t=row)} j WHERE j.value IN (ppg_min, ppg_max));
+    DELETE FROM {table} WHERE {group} AND rows <= 0;"""
+    return sql
+
+
+ROLLUP_TRIGGER_COLUMNS = "name, date, ppg_json, hrv, stress"
+
+
+def _rollup_triggers(table, key, key_expr):
+    # INSERT 는 새 행을 더하고, UPDATE 는 OLD 를 빼고 NEW 를 더하고, DELETE 는 OLD 를 뺀다 (모두 증분)
+    return f"""
+DROP TRIGGER IF EXISTS {table}_update;
+DROP TRIGGER IF EXISTS {table}_delete;
+CREATE TRIGGER IF NOT EXISTS {table}_insert AFTER INSERT ON user_data
+BEGIN{_add_row(table, key, key_expr, "NEW")}
+END;
+CREATE TRIGGER {table}_update AFTER UPDATE OF {ROLLUP_TRIGGER_COLUMNS} ON user_data
+BEGIN{_remove_row(table, key, key_expr, "OLD")}{_add_row(table, key, key_expr, "NEW")}
+END;
+CREATE TRIGGER {table}_delete AFTER DELETE ON user_data
+BEGIN{_remove_row(table, key, key_expr, "OLD")}
+END;"""
+
+
+def rebuild_rollups(conn):
+    """원본 user_data 에서 롤업 테이블을 처음부터 다시 만든다."""
+    for table, (key, key_expr) in ROLLUP_TABLES.items():
+        conn.execute(f"DELETE FROM {table}")
+        conn.execute(f"INSERT INTO {table} (name, {key}, {', '.join(_ROLLUP_COLUMNS)}) {_rollup_select(key_expr)}")
+
+
+def migrate_rollups(conn):
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    for table, (key, key_expr) in ROLLUP_TABLES.items():
+        conn.executescript(_rollup_table_sql(table, key) + _rollup_triggers(table, key, key_expr))
+    # 롤업 테이블을 새로 만든 경우에만 기존 데이터로 채운다 (이후는 트리거가 유지)
+    if not set(ROLLUP_TABLES) <= existing:
+        rebuild_rollups(conn)
+
+
+def init_db(conn):
+    """서버 시작 시 스키마 마이그레이션과 보조 테이블/트리거를 준비한다."""
+    migrate_schema(conn)
+    conn.executescript(VERSION_SCHEMA)
+    migrate_rollups(conn)
+    conn.commit()
+
+
+def fetch_rollups(cursor, name, start=None, end=None, monthly=False):
+    """
+    한 사람의 기간별 롤업 행 목록 (오래된 순). start 이상, end 미만 (YYYY-MM-DD 또는 YYYY-MM).
+    각 행은 {"key": 날짜/월, "rows": 행 수, "hrv": {"n", "sum", "sumsq", "min", "max"}, ...}
+    """
+    table = "user_monthly_rollup" if monthly else "user_daily_rollup"
+    key = ROLLUP_TABLES[table][0]
+    sql = f"SELECT {key}, {', '.join(_ROLLUP_COLUMNS)} FROM {table} WHERE name = ?"
+    params = [name]
+    if start:
+        sql += f" AND {key} >= ?"
+        params.append(start)
+    if end:
+        sql += f" AND {key} < ?"
+        params.append(end)
+    cursor.execute(sql + f" ORDER BY {key}", params)
+    result = []
+    for row in cursor.fetchall():
+        item = {"key": row[0], "rows": row[1]}
+        values = row[2:]
+        for i, m in enumerate(ROLLUP_METRICS):
+            item[m] = dict(zip(ROLLUP_FIELDS, values[i * 5:(i + 1) * 5]))
+        result.append(item)
+    return result
+
+
+def combine_rollups(rollups, metric):
+    """여러 롤업 행을 합쳐 한 지표의 개수/평균/표준편차(모)/최소/최대를 돌려준다."""
+    n = sum(r[metric]["n"] for r in rollups)
+    if n == 0:
+        return None
+    total = sum(r[metric]["sum"] for r in rollups)
+    sumsq = sum(r[metric]["sumsq"] for r in rollups)
+    mean = total / n
+    return {
+        "n": n,
+        "mean": mean,
+        "std": math.sqrt(max(sumsq / n - mean * mean, 0)),
+        "min": min(r[metric]["min"] for r in rollups if r[metric]["min"] is not None),
+        "max": max(r[metric]["max"] for r in rollups if r[metric]["max"] is not None),
+    }
+
+
+def get_data_version(cursor, name):
+    cursor.execute("SELECT version FROM user_data_version WHERE name = ?", (name,))
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+def execute_sql_and_fetch(sql: str, params=(), cursor=None):
+    # 요청 처리 중에는 그 요청의 커서를 넘겨 같은 경로로 조회한다
+    if cursor is not None:
+        return cursor.execute(sql, params).fetchall()
+    with connection() as conn:
+        return conn.execute(sql, params).fetchall()
+
+def fetch_and_compute_ppg_avg():
+    rows = execute_sql_and_fetch("SELECT name, date, ppg_mean FROM user_data WHERE ppg_count > 0")
+
+    for name, date, avg in rows:
+        print(f"{name} ({date}) → PPG 평균: {avg:.2f}")
@@ -1,7 +1,7 @@
-import sqlite3
-import json
 import random
 from datetime import datetime, timedelta
+from db import DB_PATH
+from ingest import connect, load_records
 
 # 상태별 범위 정의
 states = {
@@ -33,21 +33,8 @@ start_date = datetime.strptime("2025-06-01", "%Y-%m-%d")
 end_date = datetime.strptime("2025-07-15", "%Y-%m-%d")
 all_dates = [(start_date + timedelta(days=i)).strftime("%Y-%m-%d") for i in range((end_date - start_date).days + 1)]
 
-# DB 연결
-conn = sqlite3.connect("/home/jhyoo_2/juyeon/blue_agent/user_data.db")  # 절대경로
-cursor = conn.cursor()
-
-# 테이블이 없으면 생성 (기존 데이터 보존)
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS user_data (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    name TEXT,
-    date TEXT,
-    ppg_json TEXT,
-    hrv REAL,
-    stress REAL
-);
-""")
+# DB 연결 (테이블/인덱스/트리거가 없으면 생성, 기존 데이터 보존)
+conn = connect(DB_PATH)
 
 
 data = [
@@ -62,31 +49,20 @@ data = [
     {"name": "이지훈", "date": "2025-04-02", "hrv": 54, "stress": 33, "ppg_json": [0.50, 0.49, 0.53]},
 ]
 
-for row in data:
-    cursor.execute("SELECT COUNT(*) FROM user_data WHERE name=? AND date=?", (row["name"], row["date"]))
-    if cursor.fetchone()[0] == 0:
-        ppg_json_str = json.dumps(row["ppg_json"])
-        cursor.execute("""
-            INSERT INTO user_data (name, date, ppg_json, hrv, stress)
-            VALUES (?, ?, ?, ?, ?)
-        """, (row["name"], row["date"], ppg_json_str, row["hrv"], row["stress"]))
-
 # 자동 생성 샘플 데이터 
-for name in names:
-    selected_dates = random.sample(all_dates, 15)
-    for date in selected_dates:
-        cursor.execute("SELECT COUNT(*) FROM user_data WHERE name=? AND date=?", (name, date))
-        if cursor.fetchone()[0] == 0:
+def sample_records():
+    for name in names:
+        selected_dates = random.sample(all_dates, 15)
+        for date in selected_dates:
             state = random.choice(list(states.keys()))
             ppg, hrv, stress = generate_sample_data(state)
-            ppg_json = json.dumps(ppg)
-            cursor.execute("""
-                INSERT INTO user_data (name, date, ppg_json, hrv, stress)
-                VALUES (?, ?, ?, ?, ?)
-            """, (name, date, ppg_json, hrv, stress))
+            yield {"name": name, "date": date, "ppg": ppg, "hrv": hrv, "stress": stress}
+
 
-# 저장 후 종료
-conn.commit()
+# 이미 있는 (name, date) 는 UNIQUE 제약으로 건너뛴다
+stats = load_records(conn, data)
+sample_stats = load_records(conn, sample_records())
 conn.close()
 
-print("데이터 삽입 완료") 
+written = stats["written"] + sample_stats["written"]
+print(f"데이터 삽입 완료 ({written}행, {sample_stats['rows_per_sec']:.0f} rows/sec)")
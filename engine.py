@@ -0,0 +1,349 @@
+import threading
+import queue
+import time
+import torch
+import config
+
+
+# KV 캐시 형식 변환: 배치 합치기/고르기는 층별 (key, value) 텐서 튜플로 하고, 모델에는 Cache 객체로 넘긴다.
+# from_legacy_cache / to_legacy_cache 는 transformers 5.x 에서 없어졌거나 형식이 바뀌어 쓰지 않는다.
+def _to_legacy(past):
+    if isinstance(past, tuple):
+        return past
+    if hasattr(past, "layers"):  # transformers >= 4.56
+        return tuple((layer.keys, layer.values) for layer in past.layers)
+    return tuple(zip(past.key_cache, past.value_cache))
+
+
+def _from_legacy(past):
+    try:
+        from transformers import DynamicCache
+    except ImportError:
+        return past
+    cache = DynamicCache()
+    for layer_idx, (k, v) in enumerate(past):
+        cache.update(k, v, layer_idx)
+    return cache
+
+
+class GenerationRequest:
+    """엔진에 제출된 프롬프트 하나. wait()로 결과(새로 생성된 텍스트)를 받는다."""
+
+    def __init__(self, prompt, max_new_tokens, prefix=None, on_token=None, stop=None):
+        self.prompt = prompt
+        self.max_new_tokens = max_new_tokens
+        self.prefix = prefix
+        self.on_token = on_token
+        self.stop = stop
+        self.prompt_ids = []
+        self.token_ids = []
+        self.text = None
+        self.error = None
+        self.done = threading.Event()
+
+    def wait(self, timeout=None):
+        if not self.done.wait(timeout):
+            raise TimeoutError("생성 대기 시간이 초과되었습니다.")
+        if self.error is not None:
+            raise self.error
+        return self.text
+
+    def append(self, token_id):
+        self.token_ids.append(token_id)
+        if self.on_token is not None:
+            # 스트리밍 콜백 오류가 배치 전체를 멈추지 않도록 한다
+            try:
+                self.on_token(token_id)
+            except Exception:
+                self.on_token = None
+
+
+class PrefixEntry:
+    def __init__(self, ids, past):
+        self.ids = ids
+        self.past = past
+
+
+class PrefixCache:
+    """
+    프롬프트 템플릿의 고정 앞부분(prefix)에 대한 past_key_values 저장소.
+    마지막 토큰은 뒤 텍스트와 붙어 다르게 토큰화될 수 있으므로 캐시에서 빼고 suffix 쪽에서 다시 prefill 한다.
+    """
+
+    def __init__(self):
+        self.entries = {}
+
+    def add(self, prefix, ids, past):
+        self.entries[prefix] = PrefixEntry(ids, past)
+
+    def __contains__(self, prefix):
+        return prefix in self.entries
+
+    # 프롬프트 토큰이 실제로 캐시된 prefix 로 시작할 때만 재사용
+    def lookup(self, prefix, prompt_ids):
+        entry = self.entries.get(prefix) if prefix else None
+        if entry is None:
+            return None
+        n = len(entry.ids)
+        if len(prompt_ids) > n and prompt_ids[:n] == entry.ids:
+            return entry
+        return None
+
+
+class GenerationEngine:
+    """
+    모든 generators.py 호출이 공유하는 생성 스케줄러.
+    요청을 큐에 모아 동적으로 배치를 만들고, 디코딩 중에도 새 요청을 배치에 합류시킨다.
+    요청마다 max_new_tokens / EOS 를 따로 검사해 끝난 요청은 바로 돌려주고 배치에서 제거한다.
+    """
+
+    def __init__(self, model, tokenizer, max_batch_size=None, max_wait_ms=None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch_size = max_batch_size or config.ENGINE_MAX_BATCH_SIZE
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else config.ENGINE_MAX_WAIT_MS) / 1000
+        self.eos_id = tokenizer.eos_token_id
+        self.pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else self.eos_id
+        self.queue = queue.Queue()
+        self.prefix_cache = PrefixCache()
+        self.lock = threading.Lock()
+        self.closed = False
+        self.thread = threading.Thread(target=self._loop, name="generation-engine", daemon=True)
+        self.thread.start()
+
+    def submit(self, prompt, max_new_tokens=100, prefix=None, on_token=None, stop=None):
+        """
+        on_token 을 주면 디코딩된 토큰 id 를 생성 스레드에서 하나씩 넘긴다.
+        stop(cut(text) 를 가진 종료 조건, generators.StopCriteria) 을 주면 답이 끝난 시점에 max_new_tokens 전이라도 멈춘다.
+        """
+        req = GenerationRequest(prompt, max_new_tokens, prefix, on_token, stop)
+        self.queue.put(req)
+        return req
+
+    def generate(self, prompt, max_new_tokens=100, prefix=None, timeout=None, stop=None):
+        return self.submit(prompt, max_new_tokens, prefix, stop=stop).wait(timeout)
+
+    @torch.no_grad()
+    def add_prefix(self, prefix):
+        """템플릿 prefix 의 KV 캐시를 미리 계산해 둔다 (시작 시 한 번)."""
+        if prefix in self.prefix_cache:
+            return
+        ids = self.tokenizer(prefix)["input_ids"][:-1]
+        input_ids = torch.tensor([ids], dtype=torch.long, device=self.model.device)
+        with self.lock:
+            out = self.model(input_ids=input_ids, use_cache=True)
+        self.prefix_cache.add(prefix, ids, _to_legacy(out.past_key_values))
+
+    # 대기 중인 요청 수집: 배치가 비어 있으면 첫 요청을 기다린 뒤 max_wait 동안 더 모은다
+    def _collect(self, free_slots, block):
+        new = []
+        if free_slots <= 0:
+            return new
+        try:
+            if block:
+                new.append(self.queue.get())
+                deadline = time.monotonic() + self.max_wait
+                while len(new) < free_slots:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    new.append(self.queue.get(timeout=remaining))
+            else:
+                while len(new) < free_slots:
+                    new.append(self.queue.get_nowait())
+        except queue.Empty:
+            pass
+        # close() 가 넣은 종료 신호는 요청이 아니다
+        return [req for req in new if req is not None]
+
+    def close(self):
+        """진행 중인 요청을 마저 끝낸 뒤 생성 스레드를 멈춘다 (모델 메모리 해제용)."""
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join()
+
+    def _loop(self):
+        active = []
+        state = None
+        while not (self.closed and not active and self.queue.empty()):
+            new = self._collect(self.max_batch_size - len(active), block=not active)
+            try:
+                with self.lock:
+                    if new:
+                        new_state = self._prefill(new)
+                        state = new_state if state is None else self._merge(state, new_state)
+                        active.extend(new)
+                        active, state = self._finish(active, state)
+                    if active:
+                        state = self._step(active, state)
+                        active, state = self._finish(active, state)
+            except Exception as e:
+                for req in active + new:
+                    if not req.done.is_set():
+                        req.error = e
+                        req.done.set()
+                active, state = [], None
+
+    def _prefill(self, requests):
+        # 같은 prefix 를 쓰는 요청끼리 묶어 prefill 한 뒤 하나의 배치로 합친다
+        groups = {}
+        for req in requests:
+            req.prompt_ids = self.tokenizer(req.prompt)["input_ids"]
+            entry = self.prefix_cache.lookup(req.prefix, req.prompt_ids)
+            groups.setdefault(req.prefix if entry else None, (entry, []))[1].append(req)
+
+        state = None
+        ordered = []
+        for entry, group in groups.values():
+            group_state = self._prefill_group(group, entry)
+            state = group_state if state is None else self._merge(state, group_state)
+            ordered.extend(group)
+        # 배치 행 순서와 요청 순서를 맞춘다
+        requests[:] = ordered
+        return state
+
+    @torch.no_grad()
+    def _prefill_group(self, requests, entry):
+        # 패딩을 고려해 suffix 를 왼쪽 정렬 후 한 번에 prefill (prefix 가 있으면 그 KV 뒤에 이어서)
+        skip = len(entry.ids) if entry else 0
+        suffixes = [req.prompt_ids[skip:] for req in requests]
+        max_len = max(len(ids) for ids in suffixes)
+        input_ids = torch.full((len(requests), max_len), self.pad_id, dtype=torch.long)
+        suffix_mask = torch.zeros((len(requests), max_len), dtype=torch.long)
+        for i, ids in enumerate(suffixes):
+            input_ids[i, max_len - len(ids):] = torch.tensor(ids, dtype=torch.long)
+            suffix_mask[i, max_len - len(ids):] = 1
+        device = self.model.device
+        input_ids, suffix_mask = input_ids.to(device), suffix_mask.to(device)
+        position_ids = skip + (suffix_mask.cumsum(-1) - 1).clamp(min=0)
+
+        past = None
+        mask = suffix_mask
+        if entry:
+            past = tuple(
+                (k.expand(len(requests), -1, -1, -1).contiguous(), v.expand(len(requests), -1, -1, -1).contiguous())
+                for k, v in entry.past
+            )
+            mask = torch.cat([suffix_mask.new_ones((len(requests), skip)), suffix_mask], dim=1)
+
+        out = self.model(
+            input_ids=input_ids,
+            attention_mask=mask,
+            position_ids=position_ids,
+            past_key_values=_from_legacy(past) if past is not None else None,
+            use_cache=True,
+        )
+        next_tokens = out.logits[:, -1, :].argmax(dim=-1)
+        for req, tok in zip(requests, next_tokens.tolist()):
+            req.append(tok)
+        return {
+            "past": _to_legacy(out.past_key_values),
+            "mask": mask,
+            "last": next_tokens.unsqueeze(-1),
+            "pos": mask.sum(-1),
+        }
+
+    def _merge(self, a, b):
+        # 길이가 다른 두 배치의 KV 캐시를 왼쪽 패딩으로 맞춰 이어 붙인다
+        la, lb = a["mask"].shape[1], b["mask"].shape[1]
+        length = max(la, lb)
+
+        def pad_left(t, n, dim):
+            if n == 0:
+                return t
+            shape = list(t.shape)
+            shape[dim] = n
+            return torch.cat([t.new_zeros(shape), t], dim=dim)
+
+        past = tuple(
+            (
+                torch.cat([pad_left(ka, length - la, 2), pad_left(kb, length - lb, 2)], dim=0),
+                torch.cat([pad_left(va, length - la, 2), pad_left(vb, length - lb, 2)], dim=0),
+            )
+            for (ka, va), (kb, vb) in zip(a["past"], b["past"])
+        )
+        return {
+            "past": past,
+            "mask": torch.cat([pad_left(a["mask"], length - la, 1), pad_left(b["mask"], length - lb, 1)], dim=0),
+            "last": torch.cat([a["last"], b["last"]], dim=0),
+            "pos": torch.cat([a["pos"], b["pos"]], dim=0),
+        }
+
+    @torch.no_grad()
+    def _step(self, active, state):
+        mask = torch.cat([state["mask"], state["mask"].new_ones((state["mask"].shape[0], 1))], dim=1)
+        out = self.model(
+            input_ids=state["last"],
+            attention_mask=mask,
+            position_ids=state["pos"].unsqueeze(-1),
+            past_key_values=_from_legacy(state["past"]),
+            use_cache=True,
+        )
+        next_tokens = out.logits[:, -1, :].argmax(dim=-1)
+        for req, tok in zip(active, next_tokens.tolist()):
+            req.append(tok)
+        return {
+            "past": _to_legacy(out.past_key_values),
+            "mask": mask,
+            "last": next_tokens.unsqueeze(-1),
+            "pos": state["pos"] + 1,
+        }
+
+    def _finish(self, active, state):
+        # 끝난 요청은 결과를 넘긴 뒤 배치에서 뺀다
+        keep = []
+        for i, req in enumerate(active):
+            finished = req.token_ids[-1] == self.eos_id or len(req.token_ids) >= req.max_new_tokens
+            text, cut = None, None
+            if finished or req.stop is not None:
+                # 프롬프트는 다시 디코딩하지 않고 새 토큰만 텍스트로 만든다
+                text = self.tokenizer.decode(req.token_ids, skip_special_tokens=True)
+                cut = req.stop.cut(text) if req.stop is not None else None
+            if finished or cut is not None:
+                req.text = text[:cut] if cut is not None else text
+                req.done.set()
+            else:
+                keep.append(i)
+        if len(keep) == len(active):
+            return active, state
+        if not keep:
+            return [], None
+        return [active[i] for i in keep], self._select(state, keep)
+
+    def _select(self, state, keep):
+        idx = torch.tensor(keep, dtype=torch.long, device=state["mask"].device)
+        mask = state["mask"].index_select(0, idx)
+        # 모든 행이 패딩인 앞쪽 열은 잘라 캐시 크기를 줄인다
+        start = int((mask.sum(0) > 0).nonzero()[0])
+        past = tuple(
+            (k.index_select(0, idx)[:, :, start:], v.index_select(0, idx)[:, :, start:])
+            for k, v in state["past"]
+        )
+        return {
+            "past": past,
+            "mask": mask[:, start:],
+            "last": state["last"].index_select(0, idx),
+            "pos": state["pos"].index_select(0, idx),
+        }
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(model, tokenizer):
+    """모델마다 하나의 공유 엔진을 돌려준다."""
+    with _engines_lock:
+        engine = _engines.get(id(model))
+        if engine is None:
+            engine = GenerationEngine(model, tokenizer)
+            _engines[id(model)] = engine
+        return engine
+
+
+def release_engine(model):
+    """모델의 공유 엔진을 멈추고 등록에서 뺀다."""
+    with _engines_lock:
+        engine = _engines.pop(id(model), None)
+    if engine is not None:
+        engine.close()
@@ -1,33 +1,14 @@
-import torch
 import re
 import json
+import hashlib
+import queue
+import config
+from cache import PersistentLRUCache
 from util import extract_plot_target
 
-def generate_code_from_question(question, model, tokenizer, rows, target_name):
-    plot_target = extract_plot_target(question)
-
-    if plot_target == "ppg":
-        values = []
-        for r in rows:
-            if r[1] != target_name:
-                continue
-            ppg_raw = r[3]
-            try:
-                ppg_list = json.loads(ppg_raw) if isinstance(ppg_raw, str) else ppg_raw
-            except json.JSONDecodeError:
-                ppg_list = []
-            if isinstance(ppg_list, list):
-                values.append(sum(ppg_list) / len(ppg_list))
-            elif isinstance(ppg_list, (int, float)):
-                values.append(ppg_list)
-    elif plot_target == "hrv":
-        values = [r[4] for r in rows if r[1] == target_name]
-    elif plot_target == "stress":
-        values = [r[5] for r in rows if r[1] == target_name]
-    else:
-        values = []
 
-    prompt = f"""
+# 프롬프트 템플릿의 고정 앞부분. 시작 시 KV 캐시를 미리 만들어 두고 요청마다 뒷부분만 prefill 한다.
+CODE_PROMPT = """
 You are a Python programmer.
 
 Task:
@@ -50,17 +31,14 @@ Do NOT include explanations, comments, or examples
 Start immediately with: import matplotlib.pyplot as plt
 
 Response:"""
-    inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
-    with torch.no_grad():
-        outputs = model.generate(**inputs, max_new_tokens=300, do_sample=False)
-    return tokenizer.decode(outputs[0], skip_special_tokens=True)
 
-def generate_report_from_question(question, model, tokenizer, summary_context):
-    prompt = f"""당신은 사용자 건강 데이터를 간결하게 요약하는 시스템입니다.
+REPORT_PREFIX = """당신은 사용자 건강 데이터를 간결하게 요약하는 시스템입니다.
 
 아래는 유저들의 최근 건강 상태를 요약한 내용입니다:
 
-{summary_context}
+"""
+
+REPORT_SUFFIX = """
 
 요약 예시:
 - Response: 김유진의 HRV는 평균 25로 낮고, 스트레스는 95로 높은 편입니다.
@@ -72,19 +50,326 @@ def generate_report_from_question(question, model, tokenizer, summary_context):
 **주의: 절대 '참고:'나 부가 설명은 쓰지 마세요.**
 반드시 'Response:'로 시작하고, 구체적 수치는 문장 안에 녹여 쓰세요. 
 Response: """
-    inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
-    with torch.no_grad():
-        outputs = model.generate(**inputs, max_new_tokens=100, do_sample=False)
-    return tokenizer.decode(outputs[0], skip_special_tokens=True).strip().split("Response:")[-1].strip()
+
+HISTORY_PREFIX = """당신은 사용자 건강 조건을 판단하여 요약해주는 응답 시스템입니다.
+
+아래는 직전 대화 내용입니다:
+"""
+
+RAG_PREFIX = """당신은 사용자 질문에 대해 배경 정보를 참고해 응답하는 시스템입니다.
+사용자의 질문을 정확히 파악하고, 관련된 지표에 대해서만 답변하세요.
+
+요약 예시:
+- Response: PPG는 광용적맥파를 의미하며, 스트레스 지수와 관련 있습니다.
+- Response: HRV는 자율신경계의 균형을 판단하는 주요 지표입니다.
+
+아래 배경 문서를 참고하여 자연스럽고 간결한 한국어로 1~2문장으로 요약하세요.
+배경 문서가 질문과 관련이 없다면 "관련 정보를 찾을 수 없습니다"라고 답변하세요.
+**주의: 절대 '참고:'나 부가 설명은 쓰지 마세요.**
+반드시 'Response:'로 시작하세요.
+
+"""
+
+INTENT_PREFIX = """
+당신은 사용자 질문을 아래 목록 중 하나의 intent 유형으로 분류하는 시스템입니다.
+
+각 intent의 정의는 다음과 같습니다:
+
+- rag: 특정 수치(PPG, HRV, 스트레스 지수)의 의미, 기준, 정상 여부 등을 묻는 질문  
+- report: 특정 사람의 지표에 대한 평균, 최대/최소값, 통계 등 요약을 요청하는 질문  
+- visual: 특정 사람의 그래프나 시계열 시각화를 요청하는 질문  
+- filter_rag: 
+    1) 수치 조건(예: 90 이상, 100 미만 등)에 부합하는 사람을 찾는 질문  
+    2) HRV, 스트레스, PPG 등을 기준으로 **안정적/불안정한 상태의 사람을 찾는 질문**
+- stress_reason: 특정 사람의 스트레스가 높거나 낮은 이유를 묻는 질문  
+- chitchat: 인사, 감탄, 테스트 등 대화의 시작이나 목적 없는 간단한 말  
+
+
+사용자 질문:
+"""
+
+STRESS_REASON_PREFIX = """당신은 사용자 HRV, PPG 데이터를 기반으로 스트레스 원인을 설명하는 시스템입니다.
+
+아래 조건을 바탕으로 스트레스 원인을 설명하는 1~2문장을 작성하세요:
+- 최근값과 평균을 비교해, 수치가 얼마나 다른지 (높거나 낮음) 판단하세요.
+- HRV가 평균보다 낮다면 스트레스가 증가할 수 있습니다.
+- PPG 변동성이 높다면 스트레스 요인이 증가했을 수 있습니다.
+- 두 지표가 모두 기준과 다르면 **두 가지 모두를 근거로** 설명하세요.
+- 수치가 큰 차이가 없으면 “안정적”이나 “외부 요인 가능성”도 고려해 설명하세요.
+
+---
+
+예시 응답:
+- Response: HRV가 평균보다 낮고, PPG 변동성이 높아 스트레스가 증가한 것으로 보입니다.
+- Response: PPG 변동성이 증가했지만 HRV는 안정적입니다. 외부 요인 가능성이 있습니다.
+- Response: HRV와 PPG 모두 평소 수준으로, 스트레스 증가 원인을 특정하기 어렵습니다.
+
+
+구체적인 수치를 활용해 자연스럽고 간결한 한국어 문장으로 1~2문장 작성하세요.  
+절대 '참고:'나 '요약:' 같은 말은 포함하지 마세요. 반드시 'Response:'로 시작하세요.
+
+---
+
+"""
+
+PROMPT_PREFIXES = [CODE_PROMPT, REPORT_PREFIX, HISTORY_PREFIX, RAG_PREFIX, INTENT_PREFIX, STRESS_REASON_PREFIX]
+
+class StopCriteria:
+    """
+    템플릿별 생성 종료 조건. 새로 생성된 텍스트만 보고 답이 끝난 위치를 찾는다.
+    - stop_strings: 답 뒤에 이 문자열(예: 다음 예시의 'Response:')이 나오면 그 앞에서 끝
+    - stop_at_newline: 답 내용 뒤 첫 줄바꿈에서 끝
+    - max_sentences: 문장 끝(. ? !) 뒤에 공백이 온 횟수가 이만큼 되면 끝
+    """
+
+    MARKER = "Response:"
+
+    def __init__(self, max_sentences=None, stop_at_newline=False, stop_strings=(MARKER,)):
+        self.max_sentences = max_sentences
+        self.stop_at_newline = stop_at_newline
+        self.stop_strings = stop_strings
+
+    def _body_start(self, text):
+        # 앞 공백과 모델이 다시 쓴 'Response:' 는 답 내용이 아니다
+        start = len(text) - len(text.lstrip())
+        if text.startswith(self.MARKER, start):
+            start += len(self.MARKER)
+            start += len(text[start:]) - len(text[start:].lstrip())
+        return start
+
+    def cut(self, text):
+        """답이 끝났으면 잘라낼 위치, 아직이면 None."""
+        start = self._body_start(text)
+        ends = [i for i in (text.find(s, start) for s in self.stop_strings) if i >= 0]
+        if self.stop_at_newline:
+            i = text.find("\n", start)
+            if i >= 0:
+                ends.append(i)
+        if self.max_sentences:
+            count = 0
+            for i in range(start, len(text) - 1):
+                if text[i] in ".?!" and text[i + 1].isspace():
+                    count += 1
+                    if count >= self.max_sentences:
+                        ends.append(i + 1)
+                        break
+        return min(ends) if ends else None
+
+
+
+# 템플릿별 종료 조건: 프롬프트가 요구하는 답 길이에 맞춰 max_new_tokens 전에 멈춘다
+CODE_STOP = StopCriteria()
+REPORT_STOP = StopCriteria(max_sentences=3)
+HISTORY_STOP = StopCriteria(max_sentences=1, stop_at_newline=True)  # 한 문장으로만 답하게 한다
+RAG_STOP = StopCriteria(max_sentences=2, stop_at_newline=True)  # 1~2문장
+INTENT_STOP = StopCriteria(stop_at_newline=True)
+STRESS_REASON_STOP = StopCriteria(max_sentences=2, stop_at_newline=True)  # 1~2문장
+
+
+class ResponseStreamer:
+    """
+    생성 중인 토큰을 텍스트 조각으로 바꿔 on_text 로 넘긴다 (SSE 응답용).
+    답변 앞의 'Response:' 는 떼어내고, 모델이 'Response:' 를 다시 쓰기 시작하면 거기서 멈춘다.
+    엔진 스레드는 put() 으로 토큰 id 만 넘기고, 디코딩은 요청 스레드의 drain() 이 새 토큰 부분만 한다.
+    """
+
+    MARKER = "Response:"
+    POLL_SECONDS = 0.05
+
+    def __init__(self, on_text):
+        self.on_text = on_text
+        self.tokenizer = None
+        self.pending = queue.SimpleQueue()
+        self.ids = []
+        self.text = ""
+        self.prefix_offset = 0
+        self.read_offset = 0
+        self.sent = 0
+
+    def write(self, text):
+        # 생성 결과가 아닌 고정 텍스트 (요약 문단, 캐시된 답변 등)
+        if text:
+            self.on_text(text)
+
+    def start(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.pending = queue.SimpleQueue()
+        self.ids = []
+        self.text = ""
+        self.prefix_offset = 0
+        self.read_offset = 0
+        self.sent = 0
+
+    def put(self, token_id):
+        # 엔진 스레드에서 호출되므로 배치를 붙잡지 않도록 넣기만 한다
+        self.pending.put(token_id)
+
+    def drain(self, request):
+        """request 가 끝날 때까지 쌓인 토큰을 디코딩해 흘려보낸다 (요청 스레드에서 호출)."""
+        while True:
+            try:
+                token_id = self.pending.get(timeout=self.POLL_SECONDS)
+            except queue.Empty:
+                # done 은 마지막 put 뒤에 설정되므로 이때 비어 있으면 더 올 토큰이 없다
+                if request.done.is_set() and self.pending.empty():
+                    return
+                continue
+            self.ids.append(token_id)
+            while not self.pending.empty():
+                self.ids.append(self.pending.get_nowait())
+            self._decode()
+            self._flush(final=False)
+
+    def _decode(self):
+        # 앞 토큰과 붙어 달라지는 경계를 위해 이전 조각부터 디코딩하고, 늘어난 부분만 이어 붙인다
+        prefix_text = self.tokenizer.decode(self.ids[self.prefix_offset:self.read_offset], skip_special_tokens=True)
+        new_text = self.tokenizer.decode(self.ids[self.prefix_offset:], skip_special_tokens=True)
+        if len(new_text) > len(prefix_text) and not new_text.endswith("\ufffd"):  # 멀티바이트 문자가 덜 만들어졌으면 보류
+            self.text += new_text[len(prefix_text):]
+            self.prefix_offset = self.read_offset
+            self.read_offset = len(self.ids)
+
+    def _body(self, text):
+        text = text.lstrip()
+        if text.startswith(self.MARKER):
+            text = text[len(self.MARKER):].lstrip()
+        return text.split(self.MARKER)[0]
+
+    def _flush(self, final):
+        body = self._body(self.text)
+        end = len(body)
+        if not final:
+            # 'Response:' 의 앞부분일 수 있는 꼬리는 다음 토큰까지 보류
+            for n in range(min(len(self.MARKER) - 1, len(body)), 0, -1):
+                if self.MARKER.startswith(body[-n:]):
+                    end -= n
+                    break
+        if end > self.sent:
+            self.on_text(body[self.sent:end])
+            self.sent = end
+
+    def end(self):
+        if self.read_offset < len(self.ids):
+            # 끝까지 덜 만들어진 문자는 tokenizer 가 바꾼 그대로 내보낸다
+            prefix_text = self.tokenizer.decode(self.ids[self.prefix_offset:self.read_offset], skip_special_tokens=True)
+            self.text += self.tokenizer.decode(self.ids[self.prefix_offset:], skip_special_tokens=True)[len(prefix_text):]
+            self.read_offset = len(self.ids)
+        self._flush(final=True)
+
+
+def get_generation_engine(model, tokenizer):
+    """모델의 공유 생성 엔진. 모델 서버를 쓰면(RemoteModel) 원격 엔진."""
+    from model_server import RemoteModel
+
+    if isinstance(model, RemoteModel):
+        return model.engine
+    from engine import get_engine  # torch 는 모델을 실제로 쓸 때 불러온다
+
+    return get_engine(model, tokenizer)
+
+
+# 모든 생성 호출은 공유 엔진을 거쳐 다른 요청과 함께 배치 처리된다 (결과는 프롬프트를 뺀 새 텍스트)
+def _generate(prompt, model, tokenizer, max_new_tokens, prefix=None, streamer=None, stop=None):
+    engine = get_generation_engine(model, tokenizer)
+    if streamer is None:
+        return engine.generate(prompt, max_new_tokens=max_new_tokens, prefix=prefix, stop=stop)
+    streamer.start(tokenizer)
+    request = engine.submit(prompt, max_new_tokens=max_new_tokens, prefix=prefix, on_token=streamer.put, stop=stop)
+    streamer.drain(request)
+    output = request.wait()
+    streamer.end()
+    return output
+
+
+# rag / report / stress_reason 응답 캐시
+response_cache = PersistentLRUCache(
+    maxsize=config.RESPONSE_CACHE_SIZE,
+    ttl=config.RESPONSE_CACHE_TTL,
+    path=config.RESPONSE_CACHE_PATH or None,
+)
+
+
+def _response_key(prompt, model, max_new_tokens, data_version, stop):
+    model_name = getattr(getattr(model, "config", None), "_name_or_path", "")
+    stop = stop and [stop.max_sentences, stop.stop_at_newline, list(stop.stop_strings)]
+    payload = json.dumps([model_name, max_new_tokens, data_version, stop, prompt], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _cached_generate(prompt, model, tokenizer, max_new_tokens, prefix=None, data_version=None, streamer=None,
+                     stop=None):
+    # do_sample=False 라 프롬프트와 데이터 버전이 같으면 출력도 같다
+    key = _response_key(prompt, model, max_new_tokens, data_version, stop)
+    output = response_cache.get(key)
+    if output is None:
+        output = _generate(prompt, model, tokenizer, max_new_tokens, prefix=prefix, streamer=streamer, stop=stop)
+        response_cache.set(key, output)
+    elif streamer is not None:
+        streamer.write(output.split(ResponseStreamer.MARKER)[-1].strip())
+    return output
+
+
+def warmup_prefix_cache(model, tokenizer):
+    engine = get_generation_engine(model, tokenizer)
+    for prefix in PROMPT_PREFIXES:
+        engine.add_prefix(prefix)
+
+def generate_code_from_question(question, model, tokenizer, rows, target_name):
+    from db import ppg_values
+
+    plot_target = extract_plot_target(question)
+
+    if plot_target == "ppg":
+        values = []
+        for r in rows:
+            if r[1] != target_name:
+                continue
+            ppg_list = ppg_values(r[3])
+            if ppg_list:
+                values.append(sum(ppg_list) / len(ppg_list))
+    elif plot_target == "hrv":
+        values = [r[4] for r in rows if r[1] == target_name]
+    elif plot_target == "stress":
+        values = [r[5] for r in rows if r[1] == target_name]
+    else:
+        values = []
+
+    return _generate(CODE_PROMPT, model, tokenizer, max_new_tokens=300, prefix=CODE_PROMPT, stop=CODE_STOP)
+
+
+def _fit_context(tokenizer, context, max_tokens):
+    # 토큰 예산을 넘으면 뒤쪽 줄부터 잘라낸다
+    lines = context.splitlines()
+    while len(lines) > 1 and len(tokenizer("\n".join(lines))["input_ids"]) > max_tokens:
+        lines.pop()
+    return "\n".join(lines)
+
+
+def generate_report_from_question(question, model, tokenizer, summary_context, data_version=None, streamer=None):
+    template_tokens = len(tokenizer(REPORT_PREFIX + REPORT_SUFFIX.format(question=question))["input_ids"])
+    summary_context = _fit_context(tokenizer, summary_context, config.REPORT_MAX_PROMPT_TOKENS - template_tokens)
+    prompt = REPORT_PREFIX + summary_context + REPORT_SUFFIX.format(question=question)
+    output = _cached_generate(prompt, model, tokenizer, max_new_tokens=100, prefix=REPORT_PREFIX,
+                              data_version=data_version, streamer=streamer, stop=REPORT_STOP)
+    return output.strip().split("Response:")[-1].strip()
+
+
+def _history_context(tokenizer, chat_history):
+    # 최근 턴부터 거꾸로 담되 턴 수와 토큰 상한을 넘지 않게 한다
+    lines, used = [], 0
+    for turn in reversed(list(chat_history)[-config.HISTORY_PROMPT_TURNS:]):
+        line = f"{turn['role']}: {turn['content']}"
+        used += len(tokenizer(line)["input_ids"])
+        if used > config.HISTORY_MAX_TOKENS:
+            break
+        lines.append(line)
+    return "\n".join(reversed(lines))
 
 
 def generate_response_from_query_with_history(question, rows, chat_history, model, tokenizer):
     summary = "\n".join(f"{n}, {d}, {v}" for n, d, v in rows)
-    history_context = "\n".join([f"{turn['role']}: {turn['content']}" for turn in chat_history[-6:]])
-    prompt = f"""당신은 사용자 건강 조건을 판단하여 요약해주는 응답 시스템입니다.
-
-아래는 직전 대화 내용입니다:
-{history_context}
+    history_context = _history_context(tokenizer, chat_history)
+    prompt = HISTORY_PREFIX + f"""{history_context}
 
 사용자의 질문:
 {question}
@@ -99,88 +384,61 @@ def generate_response_from_query_with_history(question, rows, chat_history, mode
 조건을 만족하는 사람과 날짜만 자연스럽게 요약하세요. 수치는 언급하지 마세요.  
 반드시 'Response:'로 시작하는 한 문장으로만 답하세요.
 Response: """
-    inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
-    with torch.no_grad():
-        output = model.generate(**inputs, max_new_tokens=400)
-    return tokenizer.decode(output[0], skip_special_tokens=True).strip().split("Response:")[-1].strip()
+    output = _generate(prompt, model, tokenizer, max_new_tokens=400, prefix=HISTORY_PREFIX, stop=HISTORY_STOP)
+    return output.strip().split("Response:")[-1].strip()
 
-def generate_rag_response(question, context_docs, model, tokenizer):
+def generate_rag_response(question, context_docs, model, tokenizer, data_version=None, streamer=None):
     context = "\n".join(context_docs)
-    prompt = f"""당신은 사용자 질문에 대해 배경 정보를 참고해 응답하는 시스템입니다.
-사용자의 질문을 정확히 파악하고, 관련된 지표에 대해서만 답변하세요.
-
-배경 문서:
+    prompt = RAG_PREFIX + f"""배경 문서:
 {context}
 
 질문:
 {question}
 
-요약 예시:
-- Response: PPG는 광용적맥파를 의미하며, 스트레스 지수와 관련 있습니다.
-- Response: HRV는 자율신경계의 균형을 판단하는 주요 지표입니다.
-
-배경 문서를 참고하여 자연스럽고 간결한 한국어로 1~2문장으로 요약하세요.
-위 문서가 질문과 관련이 없다면 "관련 정보를 찾을 수 없습니다"라고 답변하세요.
-**주의: 절대 '참고:'나 부가 설명은 쓰지 마세요.**
-반드시 'Response:'로 시작하세요.
 Response: """
 
-    inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
-    with torch.no_grad():
-        output = model.generate(**inputs, max_new_tokens=200, do_sample=False)
+    output = _cached_generate(prompt, model, tokenizer, max_new_tokens=200, prefix=RAG_PREFIX,
+                              data_version=data_version, streamer=streamer, stop=RAG_STOP)
 
-    return tokenizer.decode(output[0], skip_special_tokens=True).strip().split("Response:")[-1].strip()
+    return output.strip().split("Response:")[-1].strip()
 
 
 # LLM 기반 intent fallback 분류
 def generate_intent_from_llm(question: str, model, tokenizer) -> str:
-    prompt = f"""
-당신은 사용자 질문을 아래 목록 중 하나의 intent 유형으로 분류하는 시스템입니다.
-
-각 intent의 정의는 다음과 같습니다:
-
-- rag: 특정 수치(PPG, HRV, 스트레스 지수)의 의미, 기준, 정상 여부 등을 묻는 질문  
-- report: 특정 사람의 지표에 대한 평균, 최대/최소값, 통계 등 요약을 요청하는 질문  
-- visual: 특정 사람의 그래프나 시계열 시각화를 요청하는 질문  
-- filter_rag: 
-    1) 수치 조건(예: 90 이상, 100 미만 등)에 부합하는 사람을 찾는 질문  
-    2) HRV, 스트레스, PPG 등을 기준으로 **안정적/불안정한 상태의 사람을 찾는 질문**
-- stress_reason: 특정 사람의 스트레스가 높거나 낮은 이유를 묻는 질문  
-- chitchat: 인사, 감탄, 테스트 등 대화의 시작이나 목적 없는 간단한 말  
-
-
-사용자 질문:
-\"{question}\"
+    prompt = INTENT_PREFIX + f"""\"{question}\"
 
 해당 질문에 가장 적절한 의도 하나를 출력하세요. 반드시 '의도:'로 시작하세요.
 
 의도:"""
-    inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
-    with torch.no_grad():
-        outputs = model.generate(**inputs, max_new_tokens=20, do_sample=False, temperature=0.0)
-    decoded = tokenizer.decode(outputs[0], skip_special_tokens=True)
+    # 결과는 새로 생성된 부분만이므로 프롬프트 끝의 '의도:' 를 붙여 같은 패턴으로 찾는다
+    decoded = "의도:" + _generate(prompt, model, tokenizer, max_new_tokens=20, prefix=INTENT_PREFIX, stop=INTENT_STOP)
     match = re.search(r"의도[:：]?\s*(rag|report|visual|filter_rag|stress_reason|chitchat)\b", decoded, re.IGNORECASE)
 
     return match.group(1).lower() if match else "ambiguous"
 
 
 # 스트레스 원인 답변 프롬프트 (ppg, hrv 데이터 기반)
-def generate_stress_reason_from_data(question, model, tokenizer, target_name, rows, specific_date=None):
-    import json
+def generate_stress_reason_from_data(question, model, tokenizer, target_name, rows, specific_date=None,
+                                     hrv_values=None, ppg_stds=None, data_version=None,
+                                     streamer=None):
     import numpy as np
+    from db import ppg_values
 
-    ppg_stds = []
-    hrv_values = []
+    # 날짜별 값이 이미 집계돼 있으면(hrv_values / ppg_stds) rows 를 다시 훑지 않는다
+    precomputed = hrv_values is not None or ppg_stds is not None
+    ppg_stds = list(ppg_stds or [])
+    hrv_values = list(hrv_values or [])
 
-    for r in rows:
+    for r in ([] if precomputed else rows):
         if r[1] != target_name:
             continue
-        try:
-            ppg = json.loads(r[3]) if isinstance(r[3], str) else r[3]
-        except:
-            ppg = []
-        if isinstance(ppg, list) and len(ppg) > 0:
-            ppg_stds.append(np.std(ppg))
+        if len(r) > 7 and r[7] is not None:
+            # 미리 계산된 행별 PPG 표준편차
+            ppg_stds.append(r[7])
+        else:
+            ppg = ppg_values(r[3])
+            if ppg:
+                ppg_stds.append(np.std(ppg))
         hrv = r[4]
         if isinstance(hrv, (int, float)):
             hrv_values.append(hrv)
@@ -197,37 +455,17 @@ def generate_stress_reason_from_data(question, model, tokenizer, target_name, ro
 
     summary_context = summary_text.strip()
 
-    prompt = f"""당신은 사용자 HRV, PPG 데이터를 기반으로 스트레스 원인을 설명하는 시스템입니다.
-
-{summary_context}
+    prompt = STRESS_REASON_PREFIX + f"""{summary_context}
 
 질문: {question}
 
----
-
-아래 조건을 바탕으로 스트레스 원인을 설명하는 1~2문장을 작성하세요:
-- 최근값과 평균을 비교해, 수치가 얼마나 다른지 (높거나 낮음) 판단하세요.
-- HRV가 평균보다 낮다면 스트레스가 증가할 수 있습니다.
-- PPG 변동성이 높다면 스트레스 요인이 증가했을 수 있습니다.
-- 두 지표가 모두 기준과 다르면 **두 가지 모두를 근거로** 설명하세요.
-- 수치가 큰 차이가 없으면 “안정적”이나 “외부 요인 가능성”도 고려해 설명하세요.
-
----
-
-예시 응답:
-- Response: HRV가 평균보다 낮고, PPG 변동성이 높아 스트레스가 증가한 것으로 보입니다.
-- Response: PPG 변동성이 증가했지만 HRV는 안정적입니다. 외부 요인 가능성이 있습니다.
-- Response: HRV와 PPG 모두 평소 수준으로, 스트레스 증가 원인을 특정하기 어렵습니다.
-
-
-구체적인 수치를 활용해 자연스럽고 간결한 한국어 문장으로 1~2문장 작성하세요.  
-절대 '참고:'나 '요약:' 같은 말은 포함하지 마세요. 반드시 'Response:'로 시작하세요.
-
 Response:"""
 
-    inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
-    with torch.no_grad():
-        output = model.generate(**inputs, max_new_tokens=200, do_sample=False)
-    reason = tokenizer.decode(output[0], skip_special_tokens=True).strip().split("Response:")[-1].strip()
-    return summary_context + "\n\n[원인 분석]\n" + reason
+    header = summary_context + "\n\n[원인 분석]\n"
+    if streamer is not None:
+        streamer.write(header)
+    output = _cached_generate(prompt, model, tokenizer, max_new_tokens=200, prefix=STRESS_REASON_PREFIX,
+                              data_version=data_version, streamer=streamer, stop=STRESS_REASON_STOP)
+    reason = output.strip().split("Response:")[-1].strip()
+    return header + reason
 
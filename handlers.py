@@ -1,31 +1,66 @@
-import json
 import statistics
+import threading
+import config
+from cache import LRUCache
+from db import get_data_version, fetch_rollups, combine_rollups, ppg_values
+from stats import summarize_rollups, answer_statistic
 from generators import (
     generate_code_from_question,
     generate_report_from_question,
     generate_response_from_query_with_history,
     generate_rag_response
 )
-from util import (extract_python_code, extract_plot_target, extract_recent_days, extract_date_or_month)
+from util import (extract_python_code, extract_plot_target, extract_recent_days, extract_date_or_month,
+                  extract_stat_request)
 from datetime import datetime, timedelta
 
-def handle_visual(question, model, tokenizer, target_name, cursor):
-    import matplotlib
-    matplotlib.use("Agg")
-    import io
-    import base64
-    import matplotlib.pyplot as plt
+# handle_visual 조회 컬럼 (앞 6개는 예전 SELECT * 와 같은 순서, PPG 는 float32 blob 이 있으면 blob 으로 읽는다)
+ROW_COLUMNS = "id, name, date, COALESCE(ppg_blob, ppg_json) AS ppg, hrv, stress, ppg_mean, ppg_std"
+
+
+def _series_values(rows, plot_target):
+    if plot_target == "ppg":
+        # 평균 PPG 값으로 변환 (미리 계산된 ppg_mean 우선)
+        values = []
+        for r in rows:
+            if len(r) > 6 and r[6] is not None:
+                values.append(r[6])
+                continue
+            lst = ppg_values(r[3])
+            if lst:
+                values.append(sum(lst)/len(lst))
+        return values
+    elif plot_target == "hrv":
+        return [r[4] for r in rows]
+    elif plot_target == "stress":
+        return [r[5] for r in rows]
+    return []
 
+
+# 렌더링된 그래프 캐시: (이름, 지표, 기간 시작일, 데이터 버전, 모드) → base64 PNG
+chart_cache = LRUCache(maxsize=config.CHART_CACHE_SIZE, ttl=config.CHART_CACHE_TTL)
+
+
+def handle_visual(question, model, tokenizer, target_name, cursor, use_codegen=None):
+    if use_codegen is None:
+        use_codegen = config.VISUAL_CODEGEN
     recent_days = extract_recent_days(question)
-    if recent_days:
-        cutoff = (datetime.today() - timedelta(days=recent_days)).strftime("%Y-%m-%d")
+    cutoff = (datetime.today() - timedelta(days=recent_days)).strftime("%Y-%m-%d") if recent_days else None
+    plot_target = extract_plot_target(question)
+
+    cache_key = (target_name, plot_target, cutoff, get_data_version(cursor, target_name), use_codegen)
+    cached = chart_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    if cutoff:
         cursor.execute(
-            "SELECT * FROM user_data WHERE name = ? AND date >= ? ORDER BY date",
+            f"SELECT {ROW_COLUMNS} FROM user_data WHERE name = ? AND date >= ? ORDER BY date",
             (target_name, cutoff)
         )
     else:
         cursor.execute(
-            "SELECT * FROM user_data WHERE name = ? ORDER BY date",
+            f"SELECT {ROW_COLUMNS} FROM user_data WHERE name = ? ORDER BY date",
             (target_name,)
         )
 
@@ -33,101 +68,87 @@ def handle_visual(question, model, tokenizer, target_name, cursor):
     if not rows:
         raise ValueError(f"{target_name}에 대한 데이터가 없습니다.")
     dates = [r[2] for r in rows]
-    plot_target = extract_plot_target(question)
-    print("시각화 대상:", plot_target)
+    values = _series_values(rows, plot_target)
 
-    if plot_target == "ppg":
-        # 평균 PPG 값으로 변환
-        values = []
-        for r in rows:
-            raw = r[3]
-            try:
-                lst = json.loads(raw) if isinstance(raw, str) else raw
-            except json.JSONDecodeError:
-                lst = []
-            if isinstance(lst, list):
-                values.append(sum(lst)/len(lst))
-            elif isinstance(lst, (int, float)):
-                values.append(lst)
-    elif plot_target == "hrv":
-        values = [r[4] for r in rows]
-    elif plot_target == "stress":
-        values = [r[5] for r in rows]
+    if use_codegen:
+        image = _render_with_codegen(question, model, tokenizer, rows, target_name, dates, values)
     else:
-        values = []
+        # 기본: LLM 없이 조회 결과로 바로 그린다
+        from charts import render_timeseries  # matplotlib 은 첫 그래프 요청 때 불러온다
 
-    llm_output = generate_code_from_question(question, model, tokenizer, rows, target_name)
-    print("LLM output:\n", llm_output)
-    code = extract_python_code(llm_output)
+        image = render_timeseries(dates, values, plot_target)
+    chart_cache.set(cache_key, image)
+    return image
 
-    plt.clf()
-    plt.figure(figsize=(10, 6))
-    exec(code, {"plt": plt, "dates": dates, "values": values})
 
-    fig = plt.gcf()
-    print("axes 개수:", len(fig.axes))
-    if fig.axes:
-        print("그래프 축 있음")
-    else:
-        print("plot 호출 안 됐거나 빈 데이터")
+# LLM 코드 생성 모드 (opt-in). pyplot 전역 상태를 쓰므로 한 번에 하나씩만 실행한다.
+_pyplot_lock = threading.Lock()
 
-    buffer = io.BytesIO()
-    plt.savefig(buffer, format="png", bbox_inches="tight")
-    buffer.seek(0)
-    img_base64 = base64.b64encode(buffer.read()).decode("utf-8")
-    print("base64 길이:", len(img_base64))
+def _render_with_codegen(question, model, tokenizer, rows, target_name, dates, values):
+    import matplotlib
+    matplotlib.use("Agg")
+    import io
+    import base64
+    import matplotlib.pyplot as plt
 
-    return img_base64
+    llm_output = generate_code_from_question(question, model, tokenizer, rows, target_name)
+    code = extract_python_code(llm_output)
 
-def handle_report(question, model, tokenizer, candidate_names, cursor):
-    target_name = next((name for name in candidate_names if name in question), None)
+    with _pyplot_lock:
+        plt.close("all")
+        plt.figure(figsize=(10, 6))
+        exec(code, {"plt": plt, "dates": dates, "values": values})
+
+        buffer = io.BytesIO()
+        plt.savefig(buffer, format="png", bbox_inches="tight")
+        plt.close("all")
+    return base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+def handle_report(question, model, tokenizer, target_name, cursor, streamer=None):
     if not target_name:
         return "특정 유저를 인식하지 못했습니다. 이름을 포함해서 다시 질문해주세요."
 
+    # 원본 행 대신 일별 롤업(O(일수))을 읽어 기간 통계를 만든다
     recent_days = extract_recent_days(question)
-    if recent_days:
-        cutoff = (datetime.today() - timedelta(days=recent_days)).strftime("%Y-%m-%d")
-        cursor.execute("SELECT * FROM user_data WHERE name = ? AND date >= ?", (target_name, cutoff))
-    else:
-        cursor.execute("SELECT * FROM user_data WHERE name = ?", (target_name,))
-    rows = cursor.fetchall()
+    cutoff = (datetime.today() - timedelta(days=recent_days)).strftime("%Y-%m-%d") if recent_days else None
+    rollups = fetch_rollups(cursor, target_name, start=cutoff)
 
-    if not rows:
+    if not rollups:
         return f"{target_name}의 해당 기간 데이터가 없습니다."
 
-    ppglists = [json.loads(r[3]) for r in rows]
-    ppg = [v for l in ppglists for v in l]
-    hrv = [r[4] for r in rows]
-    stress = [r[5] for r in rows]
-
-    summary_context = f"- {target_name}:\n  PPG: {ppg}\n  HRV: {hrv}\n  스트레스: {stress}"
-    response = generate_report_from_question(question, model, tokenizer, summary_context)
+    # 최대/최소/평균/중앙값 같은 단일 통계 질문은 모델 없이 템플릿으로 답한다
+    stat_request = extract_stat_request(question)
+    if stat_request:
+        period = f"최근 {recent_days}일" if recent_days else None
+        answer = answer_statistic(target_name, rollups, stat_request["metric"], stat_request["stats"], period)
+        if answer:
+            return answer
+
+    # 기간 길이와 무관한 고정 크기 통계 요약만 프롬프트에 넣는다
+    summary_context = summarize_rollups(target_name, rollups)
+    response = generate_report_from_question(question, model, tokenizer, summary_context,
+                                             data_version=get_data_version(cursor, target_name), streamer=streamer)
     return response.strip()
 
 
-def is_stable(hrv_list, stress_list, ppg_json_list):
-    if not hrv_list or not stress_list or not ppg_json_list:
-        return False
-    hrv_avg = sum(hrv_list) / len(hrv_list)
-    stress_avg = sum(stress_list) / len(stress_list)
+def _ppg_summary(ppg_json_list):
     ppg_flat = [v for sublist in ppg_json_list for v in sublist]
     ppg_avg = sum(ppg_flat) / len(ppg_flat)
     ppg_std = statistics.stdev(ppg_flat) if len(ppg_flat) > 1 else 0
+    return ppg_avg, ppg_std
+
+
+# 사용자별 집계값(평균/표준편차)으로 안정/불안정 판정
+def stable_by_stats(hrv_avg, stress_avg, ppg_avg, ppg_std):
     return (
         hrv_avg >= 50 and
         stress_avg <= 55 and
         0.95 <= ppg_avg <= 1.05 and
         ppg_std <= 0.08
     )
-    
-def is_unstable(hrv_list, stress_list, ppg_json_list):
-    if not hrv_list or not stress_list or not ppg_json_list:
-        return False
-    hrv_avg = sum(hrv_list) / len(hrv_list)
-    stress_avg = sum(stress_list) / len(stress_list)
-    ppg_flat = [v for sublist in ppg_json_list for v in sublist]
-    ppg_avg = sum(ppg_flat) / len(ppg_flat)
-    ppg_std = statistics.stdev(ppg_flat) if len(ppg_flat) > 1 else 0
+
+
+def unstable_by_stats(hrv_avg, stress_avg, ppg_avg, ppg_std):
     signals = 0
     if hrv_avg <= 40:
         signals += 1
@@ -140,12 +161,68 @@ def is_unstable(hrv_list, stress_list, ppg_json_list):
     return signals >= 2
 
 
+def is_stable(hrv_list, stress_list, ppg_json_list):
+    if not hrv_list or not stress_list or not ppg_json_list:
+        return False
+    hrv_avg = sum(hrv_list) / len(hrv_list)
+    stress_avg = sum(stress_list) / len(stress_list)
+    return stable_by_stats(hrv_avg, stress_avg, *_ppg_summary(ppg_json_list))
+    
+def is_unstable(hrv_list, stress_list, ppg_json_list):
+    if not hrv_list or not stress_list or not ppg_json_list:
+        return False
+    hrv_avg = sum(hrv_list) / len(hrv_list)
+    stress_avg = sum(stress_list) / len(stress_list)
+    return unstable_by_stats(hrv_avg, stress_avg, *_ppg_summary(ppg_json_list))
+
+
+# 전체 사용자의 HRV/스트레스 평균, PPG 평균/표준편차를 한 번의 쿼리로 집계
+# (행별 ppg_count/ppg_mean/ppg_std 로 전체 표본의 합과 제곱합을 복원)
+STABILITY_SQL = """
+SELECT name, AVG(hrv), AVG(stress),
+       SUM(ppg_count),
+       SUM(ppg_count * ppg_mean),
+       SUM(ppg_count * (ppg_std * ppg_std + ppg_mean * ppg_mean))
+FROM user_data {where}
+GROUP BY name
+"""
+
+
+def fetch_stability_stats(cursor, recent_days=None, date_info=None):
+    """이름 → (hrv 평균, 스트레스 평균, ppg 평균, ppg 표본표준편차). 집계할 값이 없는 사람은 빠진다."""
+    where, params = "", ()
+    if recent_days:
+        where, params = "WHERE date >= ?", ((datetime.today() - timedelta(days=recent_days)).strftime("%Y-%m-%d"),)
+    elif date_info:
+        if date_info["type"] == "day":
+            where, params = "WHERE date = ?", (date_info["value"],)
+        elif date_info["type"] == "month":
+            where, params = "WHERE date LIKE ?", (date_info["value"] + "%",)
+
+    cursor.execute(STABILITY_SQL.format(where=where), params)
+    stats = {}
+    for name, hrv_avg, stress_avg, n, s, ss in cursor.fetchall():
+        if hrv_avg is None or stress_avg is None or not n:
+            continue
+        ppg_avg = s / n
+        ppg_std = max(ss - s * s / n, 0) / (n - 1) if n > 1 else 0
+        stats[name] = (hrv_avg, stress_avg, ppg_avg, ppg_std ** 0.5)
+    return stats
+
+
+def _format_condition_rows(rows):
+    dates_by_name = {}
+    for name, date, _ in rows:
+        dates_by_name.setdefault(name, []).append(date)
+    lines = [f"- {name}: {', '.join(dates)}" for name, dates in dates_by_name.items()]
+    return "조건을 만족한 사람과 날짜:\n" + "\n".join(lines)
+
+
 def handle_filter_rag(question, model, tokenizer, chat_history, cursor, user_names):
     from db_query import query_db_by_condition, execute_sql_and_fetch
     from util import parse_numeric_condition_to_sql, normalize_column_name
     from generators import generate_response_from_query_with_history
     import re
-    from collections import defaultdict
 
     question, _ = normalize_column_name(question)
     
@@ -166,26 +243,13 @@ def handle_filter_rag(question, model, tokenizer, chat_history, cursor, user_nam
                 return (code - 0xAC00) % 28 != 0
             return False
 
+        stats = fetch_stability_stats(cursor, recent_days, date_info)
         for name in user_names:
-            if recent_days:
-                cutoff = (datetime.today() - timedelta(days=recent_days)).strftime("%Y-%m-%d")
-                cursor.execute("SELECT ppg_json, hrv, stress FROM user_data WHERE name = ? AND date >= ?", (name, cutoff))
-            elif date_info:
-                if date_info["type"] == "day":
-                    cursor.execute("SELECT ppg_json, hrv, stress FROM user_data WHERE name = ? AND date = ?", (name, date_info["value"]))
-                elif date_info["type"] == "month":
-                    cursor.execute("SELECT ppg_json, hrv, stress FROM user_data WHERE name = ? AND date LIKE ?", (name, date_info["value"] + "%"))
-            else:
-                cursor.execute("SELECT ppg_json, hrv, stress FROM user_data WHERE name = ?", (name,))
-
-            rows = cursor.fetchall()
-            hrv_list = [row[1] for row in rows if row[1] is not None]
-            stress_list = [row[2] for row in rows if row[2] is not None]
-            ppg_json_list = [json.loads(row[0]) if isinstance(row[0], str) else row[0] for row in rows if row[0]]
-
-            if stable_mode and is_stable(hrv_list, stress_list, ppg_json_list):
+            if name not in stats:
+                continue
+            if stable_mode and stable_by_stats(*stats[name]):
                 stable_users.append(name)
-            elif unstable_mode and is_unstable(hrv_list, stress_list, ppg_json_list):
+            elif unstable_mode and unstable_by_stats(*stats[name]):
                 unstable_users.append(name)
 
         if stable_mode:
@@ -205,14 +269,17 @@ def handle_filter_rag(question, model, tokenizer, chat_history, cursor, user_nam
 
     
 
-    rows = query_db_by_condition(question)
+    rows = query_db_by_condition(question, cursor)
     if rows:
+        if model is None:
+            # 모델을 불러오는 중이면 요약 문장 대신 조회 결과를 그대로 보여준다
+            return _format_condition_rows(rows)
         return generate_response_from_query_with_history(question, rows, chat_history, model, tokenizer)
 
 
     # SQL로 처리 불가능한 경우, 사용자별 평균 조건으로 간주
     column = None
-    if "ppg" in question: column = "ppg_json"
+    if "ppg" in question: column = "ppg_mean"
     elif "hrv" in question: column = "hrv"
     elif "stress" in question: column = "stress"
     else:
@@ -230,25 +297,17 @@ def handle_filter_rag(question, model, tokenizer, chat_history, cursor, user_nam
     else:
         return "비교 연산자(이상, 이하 등)를 찾을 수 없습니다."
 
-    # 전체 사용자 데이터 조회
-    sql = f"SELECT name, {column} FROM user_data"
-    rows = execute_sql_and_fetch(sql)
-    user_data = defaultdict(list)
-    for name, value in rows:
-        try:
-            parsed = json.loads(value) if isinstance(value, str) else value
-            if isinstance(parsed, list):
-                avg = sum(parsed) / len(parsed)
-            else:
-                avg = float(parsed)
-        except:
-            continue
-        user_data[name].append(avg)
+    # 월별 롤업에서 사용자별 평균 조회 (원본 행을 훑지 않는다)
+    metric = "ppg" if column == "ppg_mean" else column
+    sql = (
+        f"SELECT name, SUM({metric}_sum) / SUM({metric}_n) FROM user_monthly_rollup "
+        f"GROUP BY name HAVING SUM({metric}_n) > 0"
+    )
+    rows = execute_sql_and_fetch(sql, cursor=cursor)
 
-    # 평균 계산 + 필터링
+    # 필터링
     result = []
-    for name, values in user_data.items():
-        avg = sum(values) / len(values)
+    for name, avg in rows:
         if eval(f"{avg} {comparator} {threshold}"):
             result.append((name, avg))
     if not result:
@@ -262,26 +321,26 @@ def handle_filter_rag(question, model, tokenizer, chat_history, cursor, user_nam
 
 
 
-def handle_rag_query(question, model, tokenizer, embedder, index, corpus, top_k=3):
-    question_embedding = embedder.encode([question])
-    # 유사 문서 검색
-    D, I = index.search(question_embedding, top_k)
+def handle_rag_query(question, model, tokenizer, embedder, index, corpus, top_k=3, streamer=None):
+    from rag_utils import search_rag_index
 
-    # THRESHOLD = 1.0
-    # if D[0][0] > THRESHOLD:
-    #     return "이 질문은 관련 문서가 없어 정확한 답변이 어렵습니다."
+    # 유사 문서 검색 (정규화 임베딩의 코사인 유사도)
+    results = search_rag_index(embedder, index, question, top_k)
 
-    matched_docs = [corpus[i] for i in I[0]]
-    return generate_rag_response(question, matched_docs, model, tokenizer)
+    # 관련도 기준 미달 문서는 버리고, 하나도 없으면 LLM 호출 없이 안내
+    matched_docs = [corpus[i] for score, i in results if score >= config.RAG_MIN_SCORE]
+    if not matched_docs:
+        return "이 질문은 관련 문서가 없어 정확한 답변이 어렵습니다."
+
+    return generate_rag_response(question, matched_docs, model, tokenizer, streamer=streamer)
 
 
 # 스트레스 원인 답변 (ppg, hrv 데이터 기반) 
-def handle_stress_reason(question, model, tokenizer, candidate_names, cursor):
+def handle_stress_reason(question, model, tokenizer, target_name, cursor, streamer=None):
     from util import normalize_column_name
     from generators import generate_stress_reason_from_data
 
     question, _ = normalize_column_name(question)
-    target_name = next((name for name in candidate_names if name in question), None)
     if not target_name:
         return "누구의 스트레스 원인을 분석할지 이름을 입력해주세요."
 
@@ -291,28 +350,36 @@ def handle_stress_reason(question, model, tokenizer, candidate_names, cursor):
     # 1. 날짜 또는 월 단위
     if date_info:
         if date_info["type"] == "day":
-            cursor.execute("SELECT * FROM user_data WHERE name = ? AND date = ?", (target_name, date_info["value"]))
+            start = date_info["value"]
+            end = (datetime.strptime(start, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
         elif date_info["type"] == "month":
             start = date_info["value"] + "-01"
             end_dt = datetime.strptime(start, "%Y-%m-%d").replace(day=28) + timedelta(days=4)
             end = end_dt.replace(day=1).strftime("%Y-%m-%d")
-            cursor.execute("SELECT * FROM user_data WHERE name = ? AND date >= ? AND date < ?", (target_name, start, end))
     else:
-        cutoff = (datetime.today() - timedelta(days=recent_days)).strftime("%Y-%m-%d")
-        cursor.execute("SELECT * FROM user_data WHERE name = ? AND date >= ? ORDER BY date", (target_name, cutoff))
+        start = (datetime.today() - timedelta(days=recent_days)).strftime("%Y-%m-%d")
+        end = None
 
-    rows = cursor.fetchall()
-    if not rows:
+    # 일별 롤업에서 날짜별 HRV 평균과 PPG 변동성(표준편차)을 바로 얻는다
+    rollups = fetch_rollups(cursor, target_name, start=start, end=end)
+    if not rollups:
         period = date_info["value"] if date_info else f"최근 {recent_days}일"
         return f"{target_name}님의 {period} 데이터가 없습니다."
 
+    hrv_values = [r["hrv"]["sum"] / r["hrv"]["n"] for r in rollups if r["hrv"]["n"]]
+    ppg_stds = [combine_rollups([r], "ppg")["std"] for r in rollups if r["ppg"]["n"]]
+
     return generate_stress_reason_from_data(
         question=question,
         model=model,
         tokenizer=tokenizer,
         target_name=target_name,
-        rows=rows,
-        specific_date=date_info["value"] if date_info and date_info["type"] == "day" else None
+        rows=[],
+        specific_date=date_info["value"] if date_info and date_info["type"] == "day" else None,
+        hrv_values=hrv_values,
+        ppg_stds=ppg_stds,
+        data_version=get_data_version(cursor, target_name),
+        streamer=streamer,
     )
 
     matched_docs = [corpus[i] for i in I[0]]
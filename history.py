@@ -0,0 +1,130 @@
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+import config
+
+SESSION_COOKIE = "blueagent_session"
+
+
+def new_session_id():
+    return uuid.uuid4().hex
+
+
+class SessionHistory:
+    """세션 하나의 최근 대화 기록 (오래된 턴은 자동으로 밀려난다)."""
+
+    def __init__(self, session_id, max_turns, on_append=None):
+        self.session_id = session_id
+        self.turns = deque(maxlen=max_turns)
+        self.on_append = on_append
+        self.last_used = time.monotonic()
+
+    def append(self, turn):
+        self.turns.append(turn)
+        if self.on_append is not None:
+            self.on_append(self.session_id, turn)
+
+    def __iter__(self):
+        return iter(list(self.turns))
+
+    def __len__(self):
+        return len(self.turns)
+
+
+class HistoryStore:
+    """
+    세션 id → SessionHistory. 세션 수는 max_sessions 로, 기록은 세션당 max_turns 로 제한하고
+    idle_seconds 동안 쓰이지 않은 세션은 정리한다. path 를 주면 SQLite 에도 기록한다.
+    """
+
+    SWEEP_EVERY = 100
+
+    def __init__(self, max_turns=None, idle_seconds=None, max_sessions=None, path=None):
+        self.max_turns = max_turns or config.HISTORY_MAX_TURNS
+        self.idle_seconds = idle_seconds if idle_seconds is not None else config.HISTORY_IDLE_SECONDS
+        self.max_sessions = max_sessions or config.HISTORY_MAX_SESSIONS
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+        self.calls = 0
+        path = path if path is not None else config.HISTORY_DB_PATH
+        self.db = None
+        if path:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("""
+            CREATE TABLE IF NOT EXISTS chat_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session TEXT NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created REAL NOT NULL
+            )
+            """)
+            self.db.execute("CREATE INDEX IF NOT EXISTS idx_chat_history_session ON chat_history(session, id)")
+            self.db.commit()
+        self.db_lock = threading.Lock()
+
+    def get(self, session_id):
+        """세션 기록을 돌려준다. session_id 가 없으면 저장하지 않는 일회용 기록."""
+        if not session_id:
+            return SessionHistory(None, self.max_turns)
+        with self.lock:
+            history = self.sessions.get(session_id)
+            if history is None:
+                history = SessionHistory(session_id, self.max_turns, self._persist if self.db else None)
+                history.turns.extend(self._load(session_id))
+                self.sessions[session_id] = history
+            self.sessions.move_to_end(session_id)
+            history.last_used = time.monotonic()
+            self.calls += 1
+            if self.calls % self.SWEEP_EVERY == 0:
+                self._evict_idle()
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+        return history
+
+    def _evict_idle(self):
+        # 가장 오래 안 쓴 세션부터 순서대로 있으므로 앞에서부터 확인
+        deadline = time.monotonic() - self.idle_seconds
+        while self.sessions:
+            session_id, history = next(iter(self.sessions.items()))
+            if history.last_used > deadline:
+                break
+            del self.sessions[session_id]
+        if self.db is not None:
+            with self.db_lock:
+                self.db.execute(
+                    "DELETE FROM chat_history WHERE session IN "
+                    "(SELECT session FROM chat_history GROUP BY session HAVING MAX(created) < ?)",
+                    (time.time() - self.idle_seconds,),
+                )
+                self.db.commit()
+
+    def _load(self, session_id):
+        if self.db is None:
+            return []
+        with self.db_lock:
+            rows = self.db.execute(
+                "SELECT role, content FROM chat_history WHERE session = ? ORDER BY id DESC LIMIT ?",
+                (session_id, self.max_turns),
+            ).fetchall()
+        return [{"role": role, "content": content} for role, content in reversed(rows)]
+
+    def _persist(self, session_id, turn):
+        with self.db_lock:
+            self.db.execute(
+                "INSERT INTO chat_history (session, role, content, created) VALUES (?, ?, ?, ?)",
+                (session_id, turn["role"], turn["content"], time.time()),
+            )
+            # 세션당 max_turns 개만 남긴다
+            self.db.execute(
+                "DELETE FROM chat_history WHERE session = ? AND id NOT IN "
+                "(SELECT id FROM chat_history WHERE session = ? ORDER BY id DESC LIMIT ?)",
+                (session_id, session_id, self.max_turns),
+            )
+            self.db.commit()
+
+    def stats(self):
+        return {"sessions": len(self.sessions), "max_sessions": self.max_sessions, "max_turns": self.max_turns}
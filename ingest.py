@@ -0,0 +1,172 @@
+# 웨어러블 데이터 대량 적재
+#   python ingest.py data.csv                  # name,date,ppg,hrv,stress 헤더 CSV
+#   python ingest.py data.jsonl --upsert       # 한 줄에 하나의 JSON 레코드, 기존 (name, date) 는 덮어쓰기
+#   python ingest.py export.json               # 웨어러블 export ({"name": ..., "records": [...]} 또는 레코드 배열)
+# 레코드에 원시 파형(ppg_signal + sample_rate)이 있으면 ppg_signal 모듈로 처리해 비어 있는 ppg/hrv/stress 를 채운다.
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import time
+from itertools import islice
+from db import DB_PATH, init_db, ppg_columns, prepare_connection
+
+BATCH_SIZE = 5000
+
+INSERT_SQL = """
+INSERT INTO user_data (name, date, ppg_json, hrv, stress, ppg_blob, ppg_count, ppg_mean, ppg_std)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(name, date) DO NOTHING
+"""
+
+UPSERT_SQL = """
+INSERT INTO user_data (name, date, ppg_json, hrv, stress, ppg_blob, ppg_count, ppg_mean, ppg_std)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(name, date) DO UPDATE SET
+    ppg_json = excluded.ppg_json, hrv = excluded.hrv, stress = excluded.stress,
+    ppg_blob = excluded.ppg_blob, ppg_count = excluded.ppg_count,
+    ppg_mean = excluded.ppg_mean, ppg_std = excluded.ppg_std
+"""
+
+
+def _parse_ppg(value):
+    if value is None or value == "":
+        return []
+    if isinstance(value, (int, float)):
+        return [float(value)]
+    if isinstance(value, str):
+        value = value.strip()
+        # "[0.9, 1.0]" 형식(JSON) 또는 "0.9;1.0" 형식
+        value = json.loads(value) if value.startswith("[") else [v for v in value.split(";") if v.strip()]
+    return [float(v) for v in value]
+
+
+def _number(value):
+    if value is None or value == "":
+        return None
+    return float(value)
+
+
+def _signal_features(record):
+    """원시 PPG 파형에서 구한 {"ppg", "hrv", "stress", ...}. 파형이 없거나 박동을 찾지 못하면 None."""
+    signal = record.get("ppg_signal")
+    if signal is None or signal == "":
+        return None
+    if not record.get("sample_rate"):
+        raise ValueError(f"{record['name']} {record['date']}: ppg_signal 에는 sample_rate(Hz) 가 필요합니다.")
+    from ppg_signal import analyze_ppg, parse_signal
+
+    return analyze_ppg(parse_signal(signal), float(record["sample_rate"]))
+
+
+def to_row(record):
+    """레코드(dict) → INSERT 파라미터 튜플."""
+    ppg = _parse_ppg(record.get("ppg", record.get("ppg_json")))
+    hrv = _number(record.get("hrv"))
+    stress = _number(record.get("stress"))
+    # 직접 준 값이 우선이고, 비어 있는 필드만 파형에서 구한 값으로 채운다
+    if not ppg or hrv is None or stress is None:
+        features = _signal_features(record)
+        if features:
+            ppg = ppg or features["ppg"]
+            hrv = features["hrv"] if hrv is None else hrv
+            stress = features["stress"] if stress is None else stress
+    return (
+        record["name"],
+        record["date"],
+        json.dumps(ppg),
+        hrv,
+        stress,
+    ) + ppg_columns(ppg)
+
+
+# 입력 형식별 스트리밍 reader (파일 전체를 메모리에 올리지 않는다)
+def read_csv(path):
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        yield from csv.DictReader(f)
+
+
+def read_jsonl(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def read_export(path):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    for item in data if isinstance(data, list) else [data]:
+        if "records" in item:
+            for record in item["records"]:
+                yield {"name": item["name"], **record}
+        else:
+            yield item
+
+
+READERS = {"csv": read_csv, "jsonl": read_jsonl, "json": read_export}
+
+
+def load_records(conn, records, batch_size=BATCH_SIZE, upsert=False):
+    """
+    레코드를 batch_size 단위 트랜잭션으로 executemany 적재한다.
+    (name, date) UNIQUE 제약으로 중복 여부를 DB 가 판단하므로 행마다 SELECT 하지 않는다.
+    """
+    sql = UPSERT_SQL if upsert else INSERT_SQL
+    stats = {"read": 0, "written": 0, "seconds": 0.0}
+    started = time.perf_counter()
+    rows = (to_row(r) for r in records)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        with conn:
+            cursor = conn.executemany(sql, batch)
+        stats["read"] += len(batch)
+        stats["written"] += max(cursor.rowcount, 0)
+    stats["seconds"] = time.perf_counter() - started
+    stats["rows_per_sec"] = stats["read"] / stats["seconds"] if stats["seconds"] else 0.0
+    return stats
+
+
+def connect(path=DB_PATH):
+    conn = prepare_connection(sqlite3.connect(path))
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS user_data (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT,
+        date TEXT,
+        ppg_json TEXT,
+        hrv REAL,
+        stress REAL
+    );
+    """)
+    init_db(conn)
+    return conn
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=list(READERS), help="기본값: 확장자로 판단")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--upsert", action="store_true", help="이미 있는 (name, date) 는 새 값으로 덮어쓰기")
+    args = parser.parse_args()
+
+    fmt = args.format or os.path.splitext(args.path)[1].lstrip(".").lower()
+    if fmt not in READERS:
+        parser.error(f"알 수 없는 입력 형식: {fmt}")
+
+    conn = connect(args.db)
+    stats = load_records(conn, READERS[fmt](args.path), args.batch_size, args.upsert)
+    conn.close()
+    print(
+        f"{stats['read']}행 읽음, {stats['written']}행 기록 "
+        f"({stats['seconds']:.2f}초, {stats['rows_per_sec']:.0f} rows/sec)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# ambiguous 질문의 intent 를 LLM 대신 질의 임베딩(KR-SBERT)으로 먼저 분류한다.
+#   python intent_classifier.py            # 예시 + 기록으로 leave-one-out 정확도와 임계값별 적용 비율 확인
+import json
+import threading
+import time
+import numpy as np
+import config
+from util import normalize_column_name
+
+# generate_intent_from_llm 이 고르는 라벨과 같다
+INTENTS = ["rag", "report", "visual", "filter_rag", "stress_reason", "chitchat"]
+
+
+def load_examples(examples_path=None, log_path=None):
+    """라벨 예시 + LLM 이 판정한 기록 → [(질문, intent)]."""
+    examples = []
+    for path, from_log in [(examples_path or config.INTENT_EXAMPLES_PATH, False),
+                           (log_path if log_path is not None else config.INTENT_LOG_PATH, True)]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                records = [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            continue
+        for r in records:
+            # 기록에서는 LLM 판정만 학습에 쓴다 (분류기 자신의 판정은 제외)
+            if from_log and r.get("source") != "llm":
+                continue
+            if r.get("intent") in INTENTS:
+                examples.append((r["question"], r["intent"]))
+    return examples
+
+
+def _unit(vectors):
+    vectors = np.asarray(vectors, dtype="float32")
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+class IntentClassifier:
+    """
+    intent 별 예시 질문 임베딩의 평균(centroid)과 코사인 유사도로 분류한다.
+    1위 유사도가 min_score 이상이고 2위와 min_margin 이상 차이 날 때만 결과를 내고, 아니면 None.
+    """
+
+    def __init__(self, encoder, examples=None, min_score=None, min_margin=None, log_path=None):
+        self.encoder = encoder
+        self.min_score = min_score if min_score is not None else config.INTENT_MIN_SCORE
+        self.min_margin = min_margin if min_margin is not None else config.INTENT_MIN_MARGIN
+        self.log_path = log_path if log_path is not None else config.INTENT_LOG_PATH
+        self.log_lock = threading.Lock()
+        self.labels = []
+        self.centroids = None
+        self.fit(load_examples() if examples is None else examples)
+
+    def fit(self, examples):
+        if not examples:
+            self.labels, self.centroids = [], None
+            return
+        questions = [normalize_column_name(q)[0] for q, _ in examples]
+        vectors = _unit(self.encoder.encode(questions))
+        intents = np.array([intent for _, intent in examples])
+        self.labels = [i for i in INTENTS if (intents == i).any()]
+        self.centroids = _unit([vectors[intents == i].mean(axis=0) for i in self.labels])
+
+    def scores(self, question):
+        vector = _unit(self.encoder.encode(normalize_column_name(question)[0]))
+        return self.centroids @ vector
+
+    def predict(self, question):
+        """→ (intent 또는 None, 1위 유사도)."""
+        if self.centroids is None:
+            return None, 0.0
+        scores = self.scores(question)
+        order = np.argsort(scores)[::-1]
+        top = float(scores[order[0]])
+        margin = top - float(scores[order[1]]) if len(order) > 1 else top
+        if top < self.min_score or margin < self.min_margin:
+            return None, top
+        return self.labels[order[0]], top
+
+    def classify(self, question, fallback):
+        """분류기로 먼저 판정하고, 확신이 낮으면 fallback(question) (LLM) 결과를 쓴다."""
+        intent, score = self.predict(question)
+        source = "classifier"
+        if intent is None:
+            intent, source = fallback(question), "llm"
+        self.log(question, intent, source, score)
+        return intent
+
+    def log(self, question, intent, source, score):
+        # 재학습용 기록 (LLM 판정은 다음 fit 때 예시로 합쳐진다)
+        if not self.log_path:
+            return
+        record = {"question": question, "intent": intent, "source": source,
+                  "score": round(score, 4), "time": time.strftime("%Y-%m-%d %H:%M:%S")}
+        with self.log_lock, open(self.log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def main():
+    from rag_utils import load_embedding_model
+
+    examples = load_examples()
+    embedder = load_embedding_model()
+    vectors = _unit(embedder.encode([normalize_column_name(q)[0] for q, _ in examples], convert_to_numpy=True))
+    intents = np.array([intent for _, intent in examples])
+
+    # leave-one-out: 자기 자신을 뺀 centroid 로 분류
+    results = []
+    for i in range(len(examples)):
+        keep = np.arange(len(examples)) != i
+        labels = [l for l in INTENTS if (intents[keep] == l).any()]
+        centroids = _unit([vectors[keep][intents[keep] == l].mean(axis=0) for l in labels])
+        scores = centroids @ vectors[i]
+        order = np.argsort(scores)[::-1]
+        margin = scores[order[0]] - scores[order[1]]
+        results.append((scores[order[0]], margin, labels[order[0]] == intents[i]))
+
+    print(f"examples={len(examples)}")
+    print(f"{'min_score':>10}{'coverage':>10}{'accuracy':>10}")
+    for threshold in [0.3, 0.4, 0.5, 0.55, 0.6, 0.7, 0.8]:
+        taken = [ok for top, margin, ok in results if top >= threshold and margin >= config.INTENT_MIN_MARGIN]
+        accuracy = sum(taken) / len(taken) if taken else 0.0
+        print(f"{threshold:>10.2f}{len(taken) / len(results):>10.3f}{accuracy:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
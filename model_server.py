@@ -0,0 +1,356 @@
+# 모델 서버: 한 프로세스가 LLM 과 임베딩 모델을 올리고, 여러 웹 워커가 로컬 소켓으로 생성/임베딩을 요청한다.
+# 서버와 워커 모두 BLUEAGENT_MODEL_SERVER_AUTHKEY 에 같은 비밀 키를 설정해야 한다 (기본값 없음).
+#   python model_server.py                       # BLUEAGENT_MODEL_SERVER 주소에서 서비스 (기본 127.0.0.1:6100)
+#   python model_server.py --stub                # torch 없이 동작하는 stub 모델 (연동 테스트용)
+#   python model_server.py --ping                # 떠 있는 서버에 생성/임베딩을 한 번씩 요청해 본다
+#   BLUEAGENT_MODEL_SERVER=127.0.0.1:6100 gunicorn -w 4 app:app
+# 웹 워커 쪽에서는 RemoteModel / RemoteEmbedder 가 model / embedder 자리에 들어간다.
+# 토크나이저는 토큰 수 계산과 스트리밍 디코딩에 쓰이므로 워커마다 따로 올린다 (가볍다).
+import argparse
+import os
+import queue
+import socket
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+import config
+
+DEFAULT_ADDRESS = "127.0.0.1:6100"
+
+
+def parse_address(address):
+    address = address or config.MODEL_SERVER_ADDRESS or DEFAULT_ADDRESS
+    if ":" in address and not address.startswith("/"):
+        host, port = address.rsplit(":", 1)
+        return host, int(port)
+    return address  # 유닉스 소켓 경로
+
+
+def _authkey():
+    # 메시지가 pickle 이라 공개된 기본 키로는 띄우지 않는다
+    if not config.MODEL_SERVER_AUTHKEY:
+        raise RuntimeError("BLUEAGENT_MODEL_SERVER_AUTHKEY 를 설정해야 모델 서버를 쓰거나 띄울 수 있습니다.")
+    return config.MODEL_SERVER_AUTHKEY
+
+
+def _remove_stale_socket(path):
+    # 이전 프로세스가 남긴 유닉스 소켓 파일은 지운다. 살아 있는 서버가 쓰고 있으면 멈춘다
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX)
+    try:
+        probe.connect(path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        os.unlink(path)
+        return
+    finally:
+        probe.close()
+    raise RuntimeError(f"{path} 에서 이미 모델 서버가 실행 중입니다.")
+
+
+# ---------- stub 모델 (torch 없이 프로토콜 / 배선 확인용) ----------
+
+class StubTokenizer:
+    """문자 하나 = 토큰 하나."""
+
+    eos_token_id = 0
+    pad_token_id = 0
+    name_or_path = "stub"
+
+    def __call__(self, text):
+        return {"input_ids": [ord(ch) for ch in text]}
+
+    def decode(self, ids, skip_special_tokens=True):
+        return "".join(chr(i) for i in ids if i or not skip_special_tokens)
+
+
+class _StubRequest:
+    def __init__(self, text):
+        self.text = text
+        self.done = threading.Event()
+        self.done.set()
+
+    def wait(self, timeout=None):
+        return self.text
+
+
+class StubEngine:
+    """프롬프트 길이가 들어간 고정 답변을 토큰 단위로 흘려보내는 가짜 엔진."""
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+
+    def add_prefix(self, prefix):
+        pass
+
+    def submit(self, prompt, max_new_tokens=100, prefix=None, on_token=None, stop=None):
+        reply = f" 테스트 응답입니다. 프롬프트는 {len(prompt)}자입니다. 추가 문장입니다."
+        ids = []
+        for tok in self.tokenizer(reply)["input_ids"][:max_new_tokens]:
+            ids.append(tok)
+            if on_token is not None:
+                on_token(tok)
+            text = self.tokenizer.decode(ids)
+            cut = stop.cut(text) if stop is not None else None
+            if cut is not None:
+                return _StubRequest(text[:cut])
+        return _StubRequest(self.tokenizer.decode(ids))
+
+    def generate(self, prompt, max_new_tokens=100, prefix=None, timeout=None, stop=None):
+        return self.submit(prompt, max_new_tokens, prefix, stop=stop).wait(timeout)
+
+
+class StubEmbedder:
+    """문자 해시 bag-of-chars 임베딩 (같은 문장 → 같은 벡터)."""
+
+    dim = 768
+
+    def encode(self, texts, convert_to_numpy=True, **kwargs):
+        import numpy as np
+
+        single = isinstance(texts, str)
+        out = np.zeros((1 if single else len(texts), self.dim), dtype="float32")
+        for row, text in enumerate([texts] if single else texts):
+            for ch in text:
+                out[row, ord(ch) % self.dim] += 1.0
+        return out[0] if single else out
+
+
+# ---------- 서버 ----------
+
+def _stop_from(spec):
+    from generators import StopCriteria
+
+    return StopCriteria(*spec) if spec is not None else None
+
+
+class ModelServer:
+    def __init__(self, engine, embedder, model_name, tokenizer_name, address=None):
+        self.engine = engine
+        self.embedder = embedder
+        self.info = {"model": model_name, "tokenizer": tokenizer_name}
+        self.address = parse_address(address)
+
+    def serve_forever(self):
+        authkey = _authkey()
+        if isinstance(self.address, str):
+            _remove_stale_socket(self.address)
+        with Listener(self.address, authkey=authkey) as listener:
+            print(f"model server listening on {self.address} ({self.info['model']})")
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception:
+                    continue  # 인증 실패 등은 무시하고 다음 연결
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        # 연결 하나에서는 요청을 순서대로 처리한다. 서로 다른 연결의 생성 요청은 엔진에서 함께 배치된다.
+        with conn:
+            while True:
+                try:
+                    op, args = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    conn.send(("done", self._dispatch(conn, op, args)))
+                except (EOFError, OSError, BrokenPipeError):
+                    return
+                except Exception as e:
+                    conn.send(("error", f"{type(e).__name__}: {e}"))
+
+    def _dispatch(self, conn, op, args):
+        if op == "generate":
+            # 엔진 스레드는 토큰을 이 연결의 큐에 넣기만 하고, 전송은 연결 스레드가 한다
+            # (느리거나 멈춘 클라이언트가 배치 전체의 디코딩을 막지 않도록)
+            tokens = queue.Queue() if args.get("stream") else None
+            req = self.engine.submit(
+                args["prompt"], max_new_tokens=args["max_new_tokens"], prefix=args.get("prefix"),
+                on_token=tokens.put if tokens is not None else None, stop=_stop_from(args.get("stop")),
+            )
+            while tokens is not None:
+                try:
+                    conn.send(("token", tokens.get(timeout=0.05)))
+                except queue.Empty:
+                    if req.done.is_set() and tokens.empty():
+                        break
+            return req.wait()
+        if op == "encode":
+            return self.embedder.encode(args["texts"], convert_to_numpy=True).astype("float32")
+        if op == "add_prefix":
+            return self.engine.add_prefix(args["prefix"])
+        if op == "info":
+            return self.info
+        raise ValueError(f"알 수 없는 요청: {op}")
+
+
+# ---------- 클라이언트 (웹 워커 쪽) ----------
+
+class ModelServerClient:
+    """연결 풀을 가진 모델 서버 클라이언트. 연결 하나는 한 번에 한 요청만 쓴다."""
+
+    def __init__(self, address=None, pool_size=None):
+        self.address = parse_address(address)
+        self.pool = queue.LifoQueue(maxsize=pool_size or config.MODEL_SERVER_POOL_SIZE)
+
+    def _connect(self):
+        try:
+            return self.pool.get_nowait()
+        except queue.Empty:
+            return Client(self.address, authkey=_authkey())
+
+    def _release(self, conn):
+        try:
+            self.pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def call(self, op, on_token=None, **args):
+        conn = self._connect()
+        try:
+            conn.send((op, args))
+            while True:
+                kind, value = conn.recv()
+                if kind == "token":
+                    if on_token is not None:
+                        on_token(value)
+                    continue
+                break
+        except Exception:
+            conn.close()  # 응답 도중 끊긴 연결은 재사용하지 않는다
+            raise
+        self._release(conn)
+        if kind == "error":
+            raise RuntimeError(f"모델 서버 오류: {value}")
+        return value
+
+
+class _RemoteRequest:
+    def __init__(self, fn):
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+        threading.Thread(target=self._run, args=(fn,), daemon=True).start()
+
+    def _run(self, fn):
+        try:
+            self.result = fn()
+        except Exception as e:
+            self.error = e
+        self.done.set()
+
+    def wait(self, timeout=None):
+        if not self.done.wait(timeout):
+            raise TimeoutError("생성 대기 시간이 초과되었습니다.")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class RemoteEngine:
+    """GenerationEngine 과 같은 submit / generate / add_prefix 를 모델 서버 호출로 처리한다."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def submit(self, prompt, max_new_tokens=100, prefix=None, on_token=None, stop=None):
+        stop = stop and [stop.max_sentences, stop.stop_at_newline, list(stop.stop_strings)]
+        return _RemoteRequest(lambda: self.client.call(
+            "generate", on_token=on_token, prompt=prompt, max_new_tokens=max_new_tokens,
+            prefix=prefix, stop=stop, stream=on_token is not None,
+        ))
+
+    def generate(self, prompt, max_new_tokens=100, prefix=None, timeout=None, stop=None):
+        return self.submit(prompt, max_new_tokens, prefix, stop=stop).wait(timeout)
+
+    def add_prefix(self, prefix):
+        self.client.call("add_prefix", prefix=prefix)
+
+
+class _RemoteConfig:
+    def __init__(self, name):
+        self._name_or_path = name  # 응답 캐시 키에 쓰인다
+
+
+class RemoteModel:
+    """웹 워커에서 model 자리에 들어가는 핸들. 생성은 engine(RemoteEngine) 으로 한다."""
+
+    def __init__(self, client, name):
+        self.engine = RemoteEngine(client)
+        self.config = _RemoteConfig(name)
+
+
+class RemoteEmbedder:
+    """SentenceTransformer.encode 와 같은 방식으로 쓰는 원격 임베더."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def encode(self, texts, convert_to_numpy=True, **kwargs):
+        if isinstance(texts, str):
+            return self.client.call("encode", texts=[texts])[0]
+        return self.client.call("encode", texts=list(texts))
+
+
+def connect(address=None):
+    """→ (model, tokenizer, embedder). 토크나이저만 워커에서 직접 올린다."""
+    client = ModelServerClient(address)
+    info = client.call("info")
+    if info["tokenizer"] == "stub":
+        tokenizer = StubTokenizer()
+    else:
+        from transformers import AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(info["tokenizer"])
+    return RemoteModel(client, info["model"]), tokenizer, RemoteEmbedder(client)
+
+
+# ---------- 실행 ----------
+
+def build_server(stub=False, address=None):
+    if stub:
+        tokenizer = StubTokenizer()
+        return ModelServer(StubEngine(tokenizer), StubEmbedder(), "stub", "stub", address)
+
+    from backends import load_llm, MODEL_PATH
+    from engine import get_engine
+    from generators import warmup_prefix_cache
+    from rag_utils import load_embedding_model, EMBEDDER_NAME
+
+    model, tokenizer = load_llm()
+    warmup_prefix_cache(model, tokenizer)
+    embedder = load_embedding_model()
+    name = getattr(model.config, "_name_or_path", MODEL_PATH)
+    print(f"loaded {name} + {EMBEDDER_NAME}")
+    return ModelServer(get_engine(model, tokenizer), embedder, name, MODEL_PATH, address)
+
+
+def ping(address=None):
+    from generators import StopCriteria
+
+    model, tokenizer, embedder = connect(address)
+    t0 = time.perf_counter()
+    tokens = []
+    text = model.engine.submit("Response:", max_new_tokens=32, on_token=tokens.append,
+                               stop=StopCriteria(max_sentences=1)).wait()
+    print(f"generate: {text!r} ({len(tokens)} tokens streamed, {(time.perf_counter() - t0) * 1000:.1f} ms)")
+    t0 = time.perf_counter()
+    vectors = embedder.encode(["ppg 정상 범위", "hrv 의미"])
+    print(f"encode: shape={vectors.shape} ({(time.perf_counter() - t0) * 1000:.1f} ms)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--address", default=None, help=f"기본값: BLUEAGENT_MODEL_SERVER 또는 {DEFAULT_ADDRESS}")
+    parser.add_argument("--stub", action="store_true", help="실제 모델 대신 stub 모델로 서비스")
+    parser.add_argument("--ping", action="store_true", help="서버에 요청을 보내 동작 확인")
+    args = parser.parse_args()
+
+    if args.ping:
+        ping(args.address)
+    else:
+        build_server(args.stub, args.address).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
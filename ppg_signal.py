@@ -0,0 +1,167 @@
+import json
+import numpy as np
+
+# 원시 PPG 파형 처리: 대역 통과 → 피크 검출 → 박동 간격(IBI) → HRV 지표(RMSSD, SDNN) → 변동성/스트레스 점수.
+# 하루치 파형(25–100 Hz, 수백만 샘플)을 파이썬 루프 없이 배열 연산으로 처리한다.
+# PPG 성분은 4 Hz 이하라 높은 샘플링은 먼저 블록 평균으로 25 Hz 근처까지 줄이고, 피크 위치는 포물선 보간으로 보정한다.
+# 결과는 user_data 의 ppg(구간별 상대 맥파 진폭), hrv(RMSSD, ms), stress(0–100) 필드에 맞춘 값이다.
+
+LOW_HZ = 0.5          # 이보다 느린 성분(기저선 흔들림, 호흡)은 제거
+HIGH_HZ = 4.0         # 이보다 빠른 성분(센서 잡음)은 제거
+TARGET_HZ = 25.0      # 이 샘플링의 정수배 이상이면 블록 평균으로 낮춰서 처리
+MIN_IBI_MS = 300.0    # 200 bpm
+MAX_IBI_MS = 2000.0   # 30 bpm
+MAX_IBI_CHANGE = 0.2  # 앞 간격보다 20% 넘게 달라진 간격은 놓치거나 잘못 잡은 박동으로 본다
+PEAK_RMS_RATIO = 0.8  # 주변 2초 RMS 의 이 비율보다 낮은 극대는 피크로 보지 않는다
+PEAK_NEIGHBOR_RATIO = 0.5  # 앞뒤 피크 중 큰 쪽의 이 비율보다 낮은 피크는 dicrotic 파로 보고 버린다
+MIN_BEATS = 30        # 유효 간격이 이보다 적으면 지표를 내지 않는다
+MIN_COVERAGE = 0.6    # 유효 간격 비율이 이보다 낮으면 잡음으로 보고 지표를 내지 않는다
+HEART_RATE_RANGE = (35.0, 200.0)  # 평균 심박(bpm)이 이 범위를 벗어나면 지표를 내지 않는다
+SEGMENT_SECONDS = 3600  # ppg 값 하나 = 한 시간 구간의 평균 맥파 진폭
+# 변동성 점수: ln(RMSSD) 를 이 범위(ms)에서 0–100 으로 선형 변환. 스트레스 = 100 - 변동성
+RMSSD_RANGE = (15.0, 70.0)
+
+
+def parse_signal(value):
+    """리스트 / "[...]" JSON / "v1;v2;..." 문자열 → float 배열."""
+    if isinstance(value, str):
+        value = value.strip()
+        value = json.loads(value) if value.startswith("[") else [v for v in value.split(";") if v.strip()]
+    return np.asarray(value, dtype=float)
+
+
+def _moving_average(x, width):
+    # 누적합으로 구하는 중심 이동평균 (길이 유지, 가장자리는 끝값으로 채움)
+    width = max(int(round(width)), 1)
+    if width == 1:
+        return x
+    half = width // 2
+    c = np.cumsum(np.pad(x, (half + 1, width - 1 - half), mode="edge"))
+    c[0] = 0.0
+    return (c[width:] - c[:-width]) / width
+
+
+def decimate(x, fs):
+    """(블록 평균으로 줄인 파형, 새 샘플링 주파수). 블록 평균의 지연은 모든 피크에 같아서 간격에는 영향이 없다."""
+    factor = int(fs // TARGET_HZ)
+    if factor <= 1:
+        return x, fs
+    n = len(x) // factor * factor
+    return x[:n].reshape(-1, factor).mean(axis=1), fs / factor
+
+
+def bandpass(x, fs):
+    """이동평균 두 개로 만든 대역 통과 (약 LOW_HZ–HIGH_HZ)."""
+    x = x - x.mean()
+    detrended = x - _moving_average(x, fs / LOW_HZ)
+    return _moving_average(detrended, fs * 0.443 / HIGH_HZ)
+
+
+def _enforce_distance(peaks, heights, distance):
+    # 간격이 distance 보다 가까운 이웃 피크 쌍에서 낮은 쪽을 버리는 것을 더 없을 때까지 반복
+    keep = np.ones(len(peaks), dtype=bool)
+    while True:
+        kept = np.flatnonzero(keep)
+        close = np.flatnonzero(np.diff(peaks[kept]) < distance)
+        if len(close) == 0:
+            return peaks[keep]
+        left, right = kept[close], kept[close + 1]
+        keep[np.where(heights[left] >= heights[right], right, left)] = False
+
+
+def detect_peaks(y, fs):
+    """대역 통과된 파형의 수축기 피크 위치(샘플 인덱스)."""
+    d = np.diff(y)
+    candidates = np.flatnonzero((d[:-1] > 0) & (d[1:] <= 0)) + 1
+    # 2초 블록별 RMS (마지막 자투리는 앞 블록 값을 쓴다)
+    width = max(int(fs * 2), 1)
+    blocks = max(len(y) // width, 1)
+    rms = np.sqrt(np.mean(y[:blocks * width].reshape(blocks, -1) ** 2, axis=1))
+    block = np.minimum(candidates // width, blocks - 1)
+    candidates = candidates[y[candidates] > PEAK_RMS_RATIO * rms[block]]
+    peaks = _enforce_distance(candidates, y[candidates], int(fs * MIN_IBI_MS / 1000))
+    heights = y[peaks]
+    if len(peaks) > 2:
+        keep = np.ones(len(peaks), dtype=bool)
+        keep[1:-1] = heights[1:-1] >= PEAK_NEIGHBOR_RATIO * np.maximum(heights[:-2], heights[2:])
+        peaks = peaks[keep]
+    return peaks
+
+
+def refine_peaks(y, peaks):
+    """피크 양옆 세 점에 포물선을 맞춘 샘플 이하 단위 위치 (25 Hz 에서도 간격 오차를 40 ms 보다 훨씬 작게)."""
+    peaks = peaks[(peaks > 0) & (peaks < len(y) - 1)]
+    a, b, c = y[peaks - 1], y[peaks], y[peaks + 1]
+    denom = a - 2 * b + c
+    offset = np.divide(0.5 * (a - c), denom, out=np.zeros_like(b), where=denom != 0)
+    return peaks + np.clip(offset, -0.5, 0.5)
+
+
+def hrv_metrics(peaks, fs):
+    """
+    피크 위치(샘플 단위, 소수 가능) → {"beats", "heart_rate", "mean_ibi", "rmssd", "sdnn", "pnn50", "coverage"}.
+    유효 간격이 부족하거나, 유효 비율(coverage)이 낮거나, 평균 심박이 생리적으로 어색하면 None.
+    """
+    ibi = np.diff(peaks) * (1000.0 / fs)
+    if len(ibi) < 2:
+        return None
+    delta = np.diff(ibi)
+    valid = (ibi >= MIN_IBI_MS) & (ibi <= MAX_IBI_MS)
+    valid[1:] &= np.abs(delta) <= MAX_IBI_CHANGE * ibi[:-1]
+    nn = ibi[valid]
+    # RMSSD 는 둘 다 유효한 연속 간격 쌍에서만
+    successive = delta[valid[1:] & valid[:-1]]
+    if len(nn) < MIN_BEATS or len(successive) < 2 or valid.mean() < MIN_COVERAGE:
+        return None
+    mean_ibi = float(nn.mean())
+    if not HEART_RATE_RANGE[0] <= 60000.0 / mean_ibi <= HEART_RATE_RANGE[1]:
+        return None
+    return {
+        "beats": int(len(peaks)),
+        "heart_rate": 60000.0 / mean_ibi,
+        "mean_ibi": mean_ibi,
+        "rmssd": float(np.sqrt(np.mean(successive ** 2))),
+        "sdnn": float(nn.std(ddof=1)),
+        "pnn50": float(np.mean(np.abs(successive) > 50.0) * 100),
+        "coverage": float(valid.mean()),
+    }
+
+
+def variability_score(rmssd):
+    """RMSSD(ms) → 0–100 (높을수록 심박 변동이 크고 이완된 상태)."""
+    lo, hi = np.log(RMSSD_RANGE)
+    return float(np.clip((np.log(max(rmssd, 1e-3)) - lo) / (hi - lo) * 100, 0, 100))
+
+
+def segment_amplitudes(y, peaks, fs):
+    """SEGMENT_SECONDS 구간별 평균 맥파 진폭을 전체 중앙값으로 나눈 값 (1.0 근처)."""
+    heights = y[peaks]
+    segment = (peaks // int(fs * SEGMENT_SECONDS)).astype(np.intp)
+    counts = np.bincount(segment)
+    sums = np.bincount(segment, weights=heights)
+    has = counts > 0
+    return (sums[has] / counts[has] / np.median(heights)).tolist()
+
+
+def analyze_ppg(signal, fs):
+    """
+    원시 PPG 파형 → {"ppg", "hrv", "stress", "variability", ...hrv_metrics}.
+    박동을 충분히 찾지 못하거나 품질 기준(MIN_COVERAGE, HEART_RATE_RANGE)에 못 미치면(짧거나 잡음이 많은 파형) None.
+    """
+    signal = np.asarray(signal, dtype=float)
+    if fs <= 0 or len(signal) < fs * 2 / LOW_HZ:
+        return None
+    signal, fs = decimate(signal, fs)
+    y = bandpass(signal, fs)
+    peaks = detect_peaks(y, fs)
+    metrics = hrv_metrics(refine_peaks(y, peaks), fs)
+    if metrics is None:
+        return None
+    variability = variability_score(metrics["rmssd"])
+    return {
+        "ppg": segment_amplitudes(y, peaks, fs),
+        "hrv": metrics["rmssd"],
+        "stress": 100.0 - variability,
+        "variability": variability,
+        **metrics,
+    }
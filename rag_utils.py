@@ -1,15 +1,258 @@
+import os
 import json
+import time
+import queue
+import hashlib
+import threading
+import numpy as np
 import faiss
-from sentence_transformers import SentenceTransformer
+import config
+from cache import LRUCache
+from util import normalize_column_name
+
+EMBEDDER_NAME = "snunlp/KR-SBERT-V40K-klueNLI-augSTS"
+INDEX_DIR = "rag_index"  # 임베딩/FAISS 인덱스 저장 위치
 
 def load_embedding_model():
-    return SentenceTransformer("snunlp/KR-SBERT-V40K-klueNLI-augSTS")
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(EMBEDDER_NAME)
+
+
+def _entry_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+# 코퍼스 내용 + 임베더 이름으로 인덱스 아티팩트를 식별
+def corpus_key(corpus, embedder_name=EMBEDDER_NAME):
+    h = hashlib.sha256(embedder_name.encode("utf-8"))
+    for text in corpus:
+        h.update(_entry_hash(text).encode("ascii"))
+    return h.hexdigest()[:16]
+
+
+def _manifest_path(index_dir, embedder_name):
+    return os.path.join(index_dir, embedder_name.replace("/", "__") + ".manifest.json")
+
+
+def _atomic_write(path, write):
+    # 여러 워커가 동시에 만들어도 반쯤 쓰인 파일을 읽지 않도록 임시 파일 후 교체
+    tmp = f"{path}.{os.getpid()}.tmp"
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def _save_npy(array):
+    def write(path):
+        with open(path, "wb") as f:
+            np.save(f, array)
+    return write
+
+
+def _save_json(obj):
+    def write(path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(obj, f)
+    return write
+
+
+def _build_embeddings(corpus, embedder, index_dir, embedder_name):
+    # 이전 아티팩트가 현재 코퍼스의 앞부분이면 새 항목만 임베딩해서 이어 붙인다
+    hashes = [_entry_hash(text) for text in corpus]
+    manifest_path = _manifest_path(index_dir, embedder_name)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        prev_hashes = manifest["entries"]
+        prev_path = os.path.join(index_dir, manifest["key"] + ".npy")
+        n = len(prev_hashes)
+        if 0 < n <= len(hashes) and hashes[:n] == prev_hashes and os.path.exists(prev_path):
+            prev = np.load(prev_path, mmap_mode="r")
+            if n == len(hashes):
+                return np.asarray(prev, dtype="float32")
+            added = embedder.encode(corpus[n:], convert_to_numpy=True).astype("float32")
+            return np.concatenate([prev, added], axis=0)
+    return embedder.encode(corpus, convert_to_numpy=True).astype("float32")
+
+
+def _recall(index, queries, truth, k):
+    _, I = index.search(queries, k)
+    hits = sum(len(set(found) & set(expected)) for found, expected in zip(I.tolist(), truth.tolist()))
+    return hits / truth.size
+
+
+def _tune(index, embeddings, set_param, candidates, k=3, target=None, sample=200, noise=0.05, seed=0):
+    # 코퍼스 일부에 잡음을 더한 질의로 정확 검색 대비 목표 recall 을 만족하는 가장 작은 값을 고른다
+    # (코퍼스 벡터를 그대로 쓰면 자기 자신이 항상 찾아져 recall 이 부풀려진다)
+    target = target if target is not None else config.RAG_TARGET_RECALL
+    rng = np.random.default_rng(seed)
+    queries = embeddings[:: max(1, len(embeddings) // sample)][:sample]
+    queries = normalize_embeddings(queries + noise * rng.normal(size=queries.shape))
+    k = min(k, len(embeddings))
+    exact = faiss.IndexFlatIP(embeddings.shape[1])
+    exact.add(embeddings)
+    _, truth = exact.search(queries, k)
+    for value in candidates:
+        set_param(value)
+        if _recall(index, queries, truth, k) >= target:
+            return value
+    return candidates[-1]
+
 
-def load_rag_index(corpus_path="rag_corpus.json"):
+def make_index(embeddings, backend="flat"):
+    """정규화된 임베딩 위에 inner product(코사인 유사도) 인덱스를 만든다."""
+    d = embeddings.shape[1]
+    n = len(embeddings)
+    if backend == "ivf":
+        # 학습 데이터가 충분할 때만 IVF (nlist 당 최소 39개), 아니면 정확 검색
+        nlist = min(config.RAG_IVF_NLIST or int(4 * np.sqrt(n)), n // 39)
+        if nlist >= 2:
+            quantizer = faiss.IndexFlatIP(d)
+            index = faiss.IndexIVFFlat(quantizer, d, nlist, faiss.METRIC_INNER_PRODUCT)
+            index.train(embeddings)
+            index.add(embeddings)
+            candidates = [p for p in (1, 2, 4, 8, 16, 32, 64, 128) if p <= nlist]
+            index.nprobe = _tune(index, embeddings, lambda v: setattr(index, "nprobe", v), candidates)
+            return index
+    elif backend == "hnsw":
+        index = faiss.IndexHNSWFlat(d, config.RAG_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = 4 * config.RAG_HNSW_M
+        index.add(embeddings)
+        index.hnsw.efSearch = _tune(index, embeddings, lambda v: setattr(index.hnsw, "efSearch", v), [16, 32, 64, 128, 256])
+        return index
+    index = faiss.IndexFlatIP(d)
+    index.add(embeddings)
+    return index
+
+
+def normalize_embeddings(embeddings):
+    embeddings = np.array(embeddings, dtype="float32")
+    faiss.normalize_L2(embeddings)
+    return embeddings
+
+
+def _index_path(index_dir, key, backend):
+    return os.path.join(index_dir, f"{key}.{backend}.faiss")
+
+
+def build_rag_index(corpus, embedder, index_dir=INDEX_DIR, embedder_name=EMBEDDER_NAME, backend=None):
+    """코퍼스 임베딩과 FAISS 인덱스를 디스크에 저장하고 아티팩트 키를 돌려준다."""
+    backend = backend or config.RAG_BACKEND
+    os.makedirs(index_dir, exist_ok=True)
+    key = corpus_key(corpus, embedder_name)
+    embeddings = _build_embeddings(corpus, embedder, index_dir, embedder_name)
+
+    index = make_index(normalize_embeddings(embeddings), backend)
+
+    base = os.path.join(index_dir, key)
+    _atomic_write(base + ".npy", _save_npy(embeddings))
+    _atomic_write(_index_path(index_dir, key, backend), lambda p: faiss.write_index(index, p))
+    manifest = {"key": key, "embedder": embedder_name, "entries": [_entry_hash(t) for t in corpus]}
+    _atomic_write(_manifest_path(index_dir, embedder_name), _save_json(manifest))
+    return key
+
+
+def load_rag_index(corpus_path="rag_corpus.json", index_dir=INDEX_DIR, backend=None, embedder=None):
+    """embedder 를 주면(예: 모델 서버 클라이언트) 임베딩 모델을 직접 올리지 않는다."""
+    backend = backend or config.RAG_BACKEND
     with open(corpus_path, "r", encoding="utf-8") as f:
         corpus = json.load(f)
-    embedder = load_embedding_model()
-    embeddings = embedder.encode(corpus, convert_to_numpy=True)
-    index = faiss.IndexFlatL2(embeddings.shape[1])
-    index.add(embeddings.astype("float32"))
+    embedder = embedder or load_embedding_model()
+
+    # 같은 코퍼스/임베더/백엔드로 만든 인덱스가 있으면 mmap 으로 열어 워커끼리 페이지를 공유
+    key = corpus_key(corpus)
+    index_path = _index_path(index_dir, key, backend)
+    if not os.path.exists(index_path):
+        build_rag_index(corpus, embedder, index_dir, backend=backend)
+    # IO_FLAG_MMAP 은 벡터를 다시 메모리로 복사하므로, flat/IVF 는 IO_FLAG_MMAP_IFC 로 파일 페이지를 그대로 쓴다.
+    # HNSW 그래프는 mmap 을 지원하지 않아 일반 로드
+    flags = faiss.IO_FLAG_READ_ONLY
+    if backend != "hnsw":
+        flags |= getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+    index = faiss.read_index(index_path, flags)
     return embedder, index, corpus
+
+
+def search_rag_index(embedder, index, question, top_k=3):
+    """질문과 코사인 유사도가 높은 문서 (점수, 번호) 목록. 점수가 높을수록 관련성이 크다."""
+    query = normalize_embeddings(embedder.encode([question], convert_to_numpy=True))
+    D, I = index.search(query, top_k)
+    return [(float(score), int(i)) for score, i in zip(D[0], I[0]) if i >= 0]
+
+
+class _EncodeJob:
+    def __init__(self, texts):
+        self.texts = texts
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class QueryEncoder:
+    """
+    질의 임베딩용 래퍼. embedder.encode 와 같은 방식으로 쓴다.
+    - normalize_column_name 으로 정규화한 질문을 키로 LRU 캐시
+    - 캐시에 없는 질문은 짧은 시간 동안 모아 한 번의 forward 로 인코딩
+    """
+
+    def __init__(self, embedder, cache_size=None, max_batch_size=32, max_wait_ms=None):
+        self.embedder = embedder
+        self.cache = LRUCache(maxsize=cache_size or config.EMBED_CACHE_SIZE)
+        self.max_batch_size = max_batch_size
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else config.EMBED_MAX_WAIT_MS) / 1000
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._loop, name="query-encoder", daemon=True)
+        self.thread.start()
+
+    def encode(self, texts, **kwargs):
+        if isinstance(texts, str):
+            return self.encode([texts])[0]
+        keys = [normalize_column_name(t)[0].strip() for t in texts]
+        vectors = {}
+        missing = []
+        for key in keys:
+            if key in vectors:
+                continue
+            vec = self.cache.get(key)
+            if vec is None:
+                missing.append(key)
+            vectors[key] = vec
+        if missing:
+            job = _EncodeJob(missing)
+            self.queue.put(job)
+            job.done.wait()
+            if job.error is not None:
+                raise job.error
+            for key, vec in zip(missing, job.result):
+                self.cache.set(key, vec)
+                vectors[key] = vec
+        return np.stack([vectors[key] for key in keys])
+
+    def _loop(self):
+        while True:
+            jobs = [self.queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            count = len(jobs[0].texts)
+            while count < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    job = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                jobs.append(job)
+                count += len(job.texts)
+
+            # 동시에 들어온 질문을 중복 제거 후 한 번에 인코딩
+            unique = list(dict.fromkeys(t for job in jobs for t in job.texts))
+            try:
+                encoded = self.embedder.encode(unique, convert_to_numpy=True).astype("float32")
+                by_text = dict(zip(unique, encoded))
+                for job in jobs:
+                    job.result = [by_text[t] for t in job.texts]
+            except Exception as e:
+                for job in jobs:
+                    job.error = e
+            for job in jobs:
+                job.done.set()
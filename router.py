@@ -0,0 +1,145 @@
+import re
+from bisect import bisect_right
+from collections import deque
+from util import extract_stat_request
+
+# classify_question 의 키워드 규칙을 하나의 Aho–Corasick 자동자로 합친 라우터.
+# 질문을 한 번만 훑어 intent 신호와 사람 이름을 같이 찾는다. 판정 순서는 예전 규칙과 같다:
+#   report → visual → filter_rag(조건 + 사람) → rag → filter_rag(안정/불안정 + 사람) → chitchat → name_only → stress_reason → ambiguous
+# 안정/불안정 + 사람은 예전에는 ambiguous(LLM 분류)로 갔지만, SQL 만으로 답하므로 바로 filter_rag 로 보낸다.
+# 다만 "hrv 안정 범위 기준 있어?" 처럼 rag 키워드가 같이 있으면 예전처럼 rag 가 먼저다.
+# ambiguous 로 끝난 질문이라도 이름 + 단일 통계("김민지 hrv 평균")면 템플릿 통계 응답이 가능하므로 report 로 보낸다.
+
+KEYWORD_GROUPS = {
+    "report": ["최대", "최소", "중앙값", "요약", "통계"],
+    "visual": ["그래프", "추이", "그려줘", "시계열", "선 그래프"],
+    "condition": ["이상", "이하", "보다 큰", "보다 낮은", "조건에 맞는"],
+    "person": ["사람", "누구", "사용자", "이름", "찾아", "있어"],
+    "stability": ["안정"],  # "불안정" 도 포함
+    "rag": ["높은거야", "낮은거야", "기준", "정상", "의미", "무슨 뜻", "정의", "어때", "맞아", "괜찮아", "높은 편", "낮은 편"],
+    "cause": ["왜", "이유", "원인"],
+    "stress": ["stress", "스트레스"],  # 질문은 normalize_column_name 으로 "stress" 가 된 상태
+    "level": ["높", "많", "낮", "작"],
+}
+
+CHITCHAT_PATTERN = re.compile(r"^(안녕|ㅎ+|하+|헐|뭐야|ㅋㅋ+|ㅎㅎ+|테스트|hi|hello)$", re.IGNORECASE)
+
+
+class AhoCorasick:
+    """문자열 여러 개를 한 번에 찾는 자동자. search() 는 (끝 위치, 길이, 값) 을 돌려준다."""
+
+    def __init__(self, patterns):
+        # patterns: {문자열: [값, ...]}
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+        for word, values in patterns.items():
+            node = 0
+            for ch in word:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                node = nxt
+            self.out[node].extend((len(word), v) for v in values)
+
+        # BFS 로 실패 링크를 만들고, 접미사 노드의 출력도 합쳐 둔다
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self.goto[node].items():
+                queue.append(nxt)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def search(self, text):
+        goto, fail, out = self.goto, self.fail, self.out
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for length, value in out[node]:
+                yield i + 1, length, value
+
+
+class IntentRouter:
+    """키워드와 보호 대상자 이름을 함께 담은 라우터. route() → (intent, 질문에 나온 첫 후보 이름)."""
+
+    def __init__(self, names=()):
+        self.set_names(names)
+
+    def set_names(self, names):
+        names = list(names)
+        # 여러 이름이 나오면 candidate_names 앞쪽 이름을 고른다 (예전 선형 탐색과 같은 결과)
+        self.name_rank = {}
+        for i, name in enumerate(names):
+            self.name_rank.setdefault(name, i)
+        patterns = {}
+        for group, words in KEYWORD_GROUPS.items():
+            for word in words:
+                patterns.setdefault(word, []).append(group)
+        for name in self.name_rank:
+            if name:
+                patterns.setdefault(name, []).append(("name", name))
+        self.automaton = AhoCorasick(patterns)
+
+    def route(self, question):
+        found = set()
+        name = None
+        spans = {"cause": [], "stress": [], "level": []}
+        for end, length, value in self.automaton.search(question):
+            if isinstance(value, tuple):
+                if name is None or self.name_rank[value[1]] < self.name_rank[name]:
+                    name = value[1]
+                continue
+            found.add(value)
+            if value in spans:
+                spans[value].append((end - length, end))
+        intent = self._intent(question, found, spans)
+        if intent == "ambiguous" and name is not None and extract_stat_request(question):
+            intent = "report"
+        return intent, name
+
+    def _intent(self, question, found, spans):
+        if "report" in found:
+            return "report"
+        if "visual" in found:
+            return "visual"
+        if "condition" in found and "person" in found:
+            return "filter_rag"
+        if "rag" in found:
+            return "rag"
+        if "stability" in found and "person" in found:
+            return "filter_rag"
+        stripped = question.strip()
+        if CHITCHAT_PATTERN.match(stripped):
+            return "chitchat"
+        if stripped in self.name_rank:
+            return "name_only"
+        if all(spans.values()) and self._in_order(question, spans):
+            return "stress_reason"
+        return "ambiguous"
+
+    @staticmethod
+    def _in_order(question, spans):
+        # "(왜|이유|원인).*스트레스.*(높|많|낮|작)": 같은 줄에서 세 키워드가 겹치지 않고 이 순서로 나오는지
+        breaks = [i for i, ch in enumerate(question) if ch == "\n"]
+
+        def line(pos):
+            return bisect_right(breaks, pos)
+
+        for c_start, c_end in spans["cause"]:
+            for s_start, s_end in spans["stress"]:
+                if s_start < c_end or line(s_start) != line(c_start):
+                    continue
+                for l_start, _ in spans["level"]:
+                    if l_start >= s_end and line(l_start) == line(c_start):
+                        return True
+        return False
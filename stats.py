@@ -0,0 +1,106 @@
+import numpy as np
+from datetime import date
+
+# 리포트용 통계 단계: 일별 롤업을 NumPy 배열로 바꿔 지표별 요약을 한 번에 계산한다.
+# 결과는 기간 길이와 상관없이 지표당 한 줄의 고정 크기 텍스트가 된다.
+
+METRIC_LABELS = [("ppg", "PPG"), ("hrv", "HRV"), ("stress", "스트레스")]
+
+
+def _day_index(keys):
+    # "YYYY-MM-DD" → 첫 날 기준 경과 일수 (날짜가 비어 있는 구간도 간격을 반영)
+    ordinals = np.array([date.fromisoformat(k).toordinal() for k in keys], dtype=float)
+    return ordinals - ordinals[0]
+
+
+def summarize_metric(rollups, metric):
+    """일별 롤업 목록 → {"days", "mean", "std", "min", "max", "median", "trend", "change"} (값이 없으면 None)."""
+    n = np.array([r[metric]["n"] for r in rollups], dtype=float)
+    has = n > 0
+    if not has.any():
+        return None
+    n = n[has]
+    total = np.array([r[metric]["sum"] for r in rollups], dtype=float)[has]
+    sumsq = np.array([r[metric]["sumsq"] for r in rollups], dtype=float)[has]
+    mins = np.array([r[metric]["min"] for r in rollups], dtype=float)[has]
+    maxs = np.array([r[metric]["max"] for r in rollups], dtype=float)[has]
+
+    count = n.sum()
+    mean = total.sum() / count
+    daily = total / n  # 일별 평균
+
+    # 추세: 일별 평균에 대한 최소제곱 기울기 (하루당 변화량)
+    trend, span = 0.0, 0.0
+    if len(daily) > 1:
+        x = _day_index([r["key"] for r, ok in zip(rollups, has) if ok])
+        span = float(x[-1])
+        if span > 0:
+            trend = float(np.polyfit(x, daily, 1)[0])
+
+    return {
+        "days": int(has.sum()),
+        "mean": float(mean),
+        "std": float(np.sqrt(max(sumsq.sum() / count - mean * mean, 0.0))),
+        "min": float(mins.min()),
+        "max": float(maxs.max()),
+        "median": float(np.median(daily)),  # 롤업에는 원본 값이 없으므로 일별 평균의 중앙값
+        "trend": trend,
+        "change": trend * span,  # 기간 전체의 추세 변화량
+    }
+
+
+def _trend_word(change, scale):
+    # 기간 전체 변화량이 평균의 2% 미만이면 유지로 본다
+    if scale == 0 or abs(change) < 0.02 * abs(scale):
+        return "유지"
+    return "상승" if change > 0 else "하락"
+
+
+def summarize_rollups(target_name, rollups):
+    """handle_report 프롬프트에 넣을 고정 크기 요약 텍스트."""
+    lines = [f"- {target_name} ({rollups[0]['key']} ~ {rollups[-1]['key']}, {len(rollups)}일):"]
+    for metric, label in METRIC_LABELS:
+        s = summarize_metric(rollups, metric)
+        if not s:
+            continue
+        lines.append(
+            f"  {label}: 평균 {s['mean']:.2f}, 일별 평균의 중앙값 {s['median']:.2f}, 최소 {s['min']:.2f}, "
+            f"최대 {s['max']:.2f}, 표준편차 {s['std']:.2f}, 추세 {_trend_word(s['change'], s['mean'])}({s['trend']:+.3f}/일)"
+        )
+    return "\n".join(lines)
+
+
+# 템플릿 응답용 통계 이름 (조사까지 포함)
+STAT_PHRASES = {
+    "max": "최대값은",
+    "min": "최소값은",
+    "mean": "평균은",
+    "median": "일별 평균의 중앙값은",
+    "std": "표준편차는",
+}
+
+
+def _extreme_day(rollups, metric, stat):
+    # 최대/최소값이 나온 날짜
+    days = [r for r in rollups if r[metric]["n"]]
+    pick = max if stat == "max" else min
+    return pick(days, key=lambda r: r[metric][stat])["key"]
+
+
+def answer_statistic(target_name, rollups, metric, stats, period=None):
+    """LLM 없이 일별 롤업에서 바로 계산한 통계 응답 (해당 지표 값이 없으면 None)."""
+    s = summarize_metric(rollups, metric)
+    if not s:
+        return None
+    label = dict(METRIC_LABELS)[metric]
+    parts = []
+    for stat in stats:
+        text = f"{STAT_PHRASES[stat]} {s[stat]:.2f}"
+        if stat in ("max", "min"):
+            text += f"({_extreme_day(rollups, metric, stat)})"
+        parts.append(text)
+    period = period or "전체 기간"
+    return (
+        f"{target_name}의 {period} {label} {', '.join(parts)}입니다. "
+        f"({rollups[0]['key']} ~ {rollups[-1]['key']}, {s['days']}일 기준)"
+    )
@@ -0,0 +1,35 @@
+from router import IntentRouter
+from util import normalize_column_name
+
+NAMES = ["김민지", "이지훈", "박서연"]
+
+
+def route(question):
+    return IntentRouter(NAMES).route(normalize_column_name(question)[0])
+
+
+def test_rag_keyword_wins_over_stability():
+    assert route("hrv 안정 범위 기준 있어?") == ("rag", None)
+
+
+def test_stability_with_person_goes_to_filter_rag():
+    assert route("요즘 불안정한 사람 누구야?") == ("filter_rag", None)
+    assert route("안정 상태인 사용자 찾아줘") == ("filter_rag", None)
+
+
+def test_condition_with_person_goes_to_filter_rag():
+    assert route("stress 70 이상인 사람 누구야?") == ("filter_rag", None)
+
+
+def test_named_stat_question_goes_to_report():
+    assert route("김민지 hrv 평균 알려줘") == ("report", "김민지")
+    assert route("이지훈 스트레스 평균은?") == ("report", "이지훈")
+
+
+def test_stat_question_without_name_stays_ambiguous():
+    assert route("hrv 평균 알려줘") == ("ambiguous", None)
+
+
+def test_stress_reason_after_normalization():
+    assert route("김민지 왜 스트레스가 높아?") == ("stress_reason", "김민지")
+    assert route("이지훈 원인이 뭐길래 스트레스 지수가 낮지") == ("stress_reason", "이지훈")
@@ -105,3 +105,32 @@ def extract_date_or_month(question: str):
         except:
             pass
     return None
+
+
+# 단일 통계 질문 ("stress 최대값", "hrv 평균 알려줘") 인식용 키워드
+STAT_KEYWORDS = [
+    ("max", r"최대|최고|가장\s*높"),
+    ("min", r"최소|최저|가장\s*낮"),
+    ("mean", r"평균"),
+    ("median", r"중앙값|중간값"),
+    ("std", r"표준\s*편차"),
+]
+# 해석/서술이 필요한 질문은 LLM 으로 보낸다
+NARRATIVE_PATTERN = r"왜|이유|원인|어때|어떤가|어떻|해석|설명|분석|요약|평가|비교|추세|변화|조언|괜찮|리포트|보고서"
+
+
+def extract_stat_request(question: str):
+    """
+    지표 하나에 대한 통계값 질문이면 {"metric": ..., "stats": [...]} 반환, 아니면 None.
+    (질문은 normalize_column_name 을 거쳐 stress/ppg/hrv 로 바뀐 상태를 가정)
+    """
+    import re
+    if re.search(NARRATIVE_PATTERN, question):
+        return None
+    metrics = {m for m in re.findall(r"stress|ppg|hrv", question.lower())}
+    if len(metrics) != 1:
+        return None
+    stats = [name for name, pattern in STAT_KEYWORDS if re.search(pattern, question)]
+    if not stats:
+        return None
+    return {"metric": metrics.pop(), "stats": stats}